@@ -0,0 +1,136 @@
+from django.db import connection
+
+DIRTY = 'projects:statistics:dirty'
+# counters are persisted every few minutes, keys of projects without new views expire after a day
+TTL = 24 * 60 * 60
+
+
+def views_key(project_id):
+    return f'project:{project_id}:views'
+
+
+def responses_key(project_id):
+    return f'project:{project_id}:responses'
+
+
+def viewers_key(project_id):
+    return f'project:{project_id}:viewers'
+
+
+def record_view(pipeline, project_id, user_id):
+    """Add view counting commands to the redis pipeline"""
+    pipeline.incr(views_key(project_id))
+    pipeline.pfadd(viewers_key(project_id), user_id)
+    pipeline.expire(views_key(project_id), TTL)
+    pipeline.expire(viewers_key(project_id), TTL)
+    pipeline.sadd(DIRTY, project_id)
+
+
+def record_response(project_id):
+    try:
+        from django_redis import get_redis_connection
+        pipeline = get_redis_connection('default').pipeline(transaction=False)
+        pipeline.incr(responses_key(project_id))
+        pipeline.expire(responses_key(project_id), TTL)
+        pipeline.sadd(DIRTY, project_id)
+        pipeline.execute()
+    except Exception as e:
+        print(e)
+
+
+def persist(batch=500):
+    """
+    Move counters of changed projects to ProjectStatistics.
+    Viewers HyperLogLog is merged with the saved copy, so the estimate survives a redis restart.
+    Counters are decreased by the saved values only after commit and the keys expire after TTL,
+    a failed write returns the projects to the dirty set
+    """
+    from django.db import transaction
+    from django_redis import get_redis_connection
+    from api.models import ProjectStatistics
+    redis = get_redis_connection('default')
+    persisted = 0
+    while True:
+        ids = [int(pk) for pk in redis.spop(DIRTY, batch)]
+        if not ids:
+            return persisted
+        try:
+            rows = read(redis, ids)
+            if rows:
+                with transaction.atomic():
+                    table = ProjectStatistics._meta.db_table
+                    values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))
+                    sql = f'INSERT INTO {table} (project_id, views, responses, viewers, viewers_hll) ' \
+                          f'VALUES {values} ON CONFLICT (project_id) DO UPDATE SET ' \
+                          f'views = {table}.views + EXCLUDED.views, ' \
+                          f'responses = {table}.responses + EXCLUDED.responses, viewers = EXCLUDED.viewers, ' \
+                          f'viewers_hll = EXCLUDED.viewers_hll'
+                    with connection.cursor() as cursor:
+                        cursor.execute(sql, [value for row in rows for value in row])
+                    transaction.on_commit(lambda rows=rows: reset(redis, rows))
+        except Exception:
+            redis.sadd(DIRTY, *ids)
+            raise
+        persisted += len(rows)
+
+
+def read(redis, ids):
+    """[(project_id, views, responses, viewers, hll)] of existing projects, keys of deleted ones are removed"""
+    from api.models import Project, ProjectStatistics
+    existing = list(Project.objects.filter(id__in=ids).values_list('id', flat=True))
+    deleted = set(ids) - set(existing)
+    if deleted:
+        redis.delete(*[key(pk) for pk in deleted for key in (views_key, responses_key, viewers_key)])
+    ids = existing
+    saved = dict(ProjectStatistics.objects.filter(project_id__in=ids, viewers_hll__isnull=False).values_list(
+        'project_id', 'viewers_hll'))
+
+    pipeline = redis.pipeline(transaction=False)
+    for pk, hll in saved.items():
+        pipeline.set(f'{viewers_key(pk)}:saved', bytes(hll), ex=60)
+        pipeline.pfmerge(viewers_key(pk), viewers_key(pk), f'{viewers_key(pk)}:saved')
+    for pk in ids:
+        pipeline.get(views_key(pk))
+        pipeline.get(responses_key(pk))
+        pipeline.pfcount(viewers_key(pk))
+        pipeline.get(viewers_key(pk))
+    results = pipeline.execute()[len(saved) * 2:]
+
+    rows = []
+    for i, pk in enumerate(ids):
+        views, responses, viewers, hll = results[i * 4:i * 4 + 4]
+        rows.append((pk, int(views or 0), int(responses or 0), viewers, hll))
+    return rows
+
+
+def reset(redis, rows):
+    """Subtract saved counters, views made meanwhile stay, and let the keys expire"""
+    pipeline = redis.pipeline(transaction=False)
+    for pk, views, responses, viewers, hll in rows:
+        if views:
+            pipeline.decrby(views_key(pk), views)
+        if responses:
+            pipeline.decrby(responses_key(pk), responses)
+        for key in (views_key, responses_key, viewers_key):
+            pipeline.expire(key(pk), TTL)
+    pipeline.execute()
+
+
+def project_statistics(project_id):
+    """Saved counters with those not persisted yet"""
+    from api.models import ProjectStatistics
+    statistics = ProjectStatistics.objects.filter(project_id=project_id).first() or ProjectStatistics()
+    result = {'views': statistics.views, 'responses': statistics.responses, 'viewers': statistics.viewers}
+    try:
+        from django_redis import get_redis_connection
+        pipeline = get_redis_connection('default').pipeline(transaction=False)
+        pipeline.get(views_key(project_id))
+        pipeline.get(responses_key(project_id))
+        pipeline.pfcount(viewers_key(project_id))
+        views, responses, viewers = pipeline.execute()
+        result['views'] += int(views or 0)
+        result['responses'] += int(responses or 0)
+        result['viewers'] = max(result['viewers'], viewers)
+    except Exception as e:
+        print(e)
+    return result
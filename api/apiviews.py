@@ -1,16 +1,22 @@
 import re
 from abc import ABCMeta, abstractmethod
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from django.conf import settings
 from django.contrib.auth import authenticate
-from django.contrib.auth.models import User
+from django.contrib.auth.models import update_last_login
 from django.core.paginator import Paginator
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, Q
 from django.db.models.functions import Round
+from django.http import StreamingHttpResponse, Http404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from api.models import Project, Client, Day, UserProfile, Tag, ProfileTag, ProjectShowing, Account
+from api import signup, search_cache
+from api.models import Project, Client, Day, UserProfile, Tag, ProfileTag, ProjectShowing, Account, Tombstone
 from api.serializers import ClientSerializer, TagSerializer, AccountSerializer, \
     ClientItemSerializer, ProfileItemSerializer, ProfileItemShortSerializer, \
     SeriesFillingSerializer, ProjectListItemSerializer, ProfileSerializer
@@ -18,6 +24,13 @@ from api.serializers import ClientSerializer, TagSerializer, AccountSerializer,
 date_format = '%Y-%m-%d'
 
 
+def sync_response(result, cursor):
+    """Response with the cursor for the next delta request (?since=<cursor>)"""
+    response = Response(result)
+    response['X-Sync-Cursor'] = cursor
+    return response
+
+
 class ListView(APIView, metaclass=ABCMeta):
     serializer = ...
 
@@ -42,6 +55,17 @@ class ListView(APIView, metaclass=ABCMeta):
             'pages': pages
         }
 
+    def get_delta(self, queryset, data, changed, deleted, **kwargs):
+        """
+        Changed items visible in the list and ids of items to be removed by a client.
+        changed, deleted - sets of ids changed and deleted since the cursor
+        """
+        items = list(queryset.search(**data).filter(id__in=changed))
+        return {
+            'list': self.serializer(items, many=True, **kwargs).data,
+            'deleted': sorted(deleted | (changed - {item.id for item in items}))
+        }
+
 
 class LoginView(APIView):
     permission_classes = ()
@@ -106,7 +130,7 @@ class SignupView(APIView):
 
     def get(self, request):
         params = {key: (value[0] if isinstance(value, list) else value) for key, value in request.GET.items()}
-        error = self.validate(**params)
+        error = self.validate(fast=True, **params)
         if error:
             return Response({'error': error})
         return Response({})
@@ -120,7 +144,9 @@ class SignupView(APIView):
         Account.create(**request.data)
         return Response({})
 
-    def validate(self, **kwargs):
+    def validate(self, fast=False, **kwargs):
+        """fast - check taken values with api.signup sets, used for live validation"""
+        is_taken = signup.is_taken if fast else signup.in_database
         username = kwargs.get("username")
         email = kwargs.get("email")
         phone = kwargs.get("phone")
@@ -132,13 +158,13 @@ class SignupView(APIView):
                 error = 'Имя пользователя не может быть короче 4х симоволов'
             elif re.match('[^a-z0-9_]', username):
                 error = 'Имя пользователя может содержать только латинские буквы, цифры и нижнее подчеркивание'
-            elif User.objects.filter(username=username).count() != 0:
+            elif is_taken('username', username):
                 error = 'Имя пользователя занято'
         if email:
-            if Account.objects.filter(email_confirm=email).count() != 0:
+            if is_taken('email', email):
                 error = 'Пользователь с таким e-mail уже зарегистрирован'
         if phone:
-            if Account.objects.filter(phone_confirm=phone).count() != 0:
+            if is_taken('phone', phone):
                 error = 'Пользователь с таким телефоном уже зарегистрирован'
         return error
 
@@ -148,13 +174,12 @@ class RecoveryView(APIView):
 
     def get(self, request):
         account = Account.get(request.GET.get('user'))
-        code = request.GET.get('code')
-        token = account.token()[6:]
-        if not account or not code or code != token:
+        if not account or not account.check_code('recovery', request.GET.get('code')):
             return Response({'error': 'Неверная ссылка'})
+        update_last_login(None, account.user)
         return Response({
             'account': AccountSerializer(account).data,
-            'token': account.token(new=True),
+            'token': account.token(),
             'message': 'Доступ восстановлен. Рекомендуем установить новый пароль'
         })
 
@@ -223,7 +248,7 @@ class ProjectView(APIView):
             project = Project.objects.filter(pk=pk).first()
             if project:
                 if not project.user and project.creator != asker and not project.is_series:
-                    ProjectShowing.objects.get_or_create(project_id=pk, user=asker, **request.data)
+                    ProjectShowing.objects.view(pk, asker.id)
                 page = project.page(asker)
                 if page:
                     return Response(page)
@@ -334,19 +359,33 @@ class ClientView(APIView):
 
 
 class DaysOffView(APIView):
+    max_range = 731
+
     def post(self, request):
+        """
+        days: list of dates
+        ranges: list of {start, end, weekdays}, weekdays are ISO numbers (1 - monday, 7 - sunday), e.g.
+        {"start": "2021-10-01", "end": "2021-12-31", "weekdays": [6, 7]} for every weekend through December
+        """
         profile = UserProfile.get(request)
-        dop = profile.days_off_project
         pick = request.data.get('pick')
         days = request.data.get('days', [])
         dates = [datetime.strptime(day, date_format).date() for day in days]
-        if pick:
-            existing = [day.date for day in Day.objects.filter(project=dop, date__in=dates)]
-            dates = list(set(dates) - set(existing))
-            objects = [Day(project=dop, date=date) for date in dates]
-            Day.objects.bulk_create(objects)
-        else:
-            Day.objects.filter(project=dop, date__in=dates).delete()
+        ranges = []
+        for item in request.data.get('ranges', []):
+            start = datetime.strptime(item['start'], date_format).date()
+            end = datetime.strptime(item['end'], date_format).date()
+            if start > end or (end - start).days > self.max_range:
+                return Response({'error': 'Неверный период'})
+            weekdays = item.get('weekdays') or []
+            try:
+                weekdays = {int(weekday) for weekday in weekdays}
+            except (TypeError, ValueError):
+                return Response({'error': 'Неверные дни недели'})
+            if not weekdays <= set(range(1, 8)):
+                return Response({'error': 'Неверные дни недели'})
+            ranges.append((start, end, sorted(weekdays) or None))
+        profile.set_days_off(pick, dates, ranges)
         return Response({})
 
 
@@ -355,12 +394,50 @@ class ProfilesView(ListView):
     serializer = ProfileItemSerializer
 
     def search(self, request, data):
+        """First pages come from search_cache, deeper ones from the database"""
         asker = UserProfile.get(request.user)
-        if asker:
-            data = dict(data)
-            data['asker'] = asker
+        query = search_cache.normalize(data)
+        error = self.validate(query)
+        if error:
+            return Response({'error': error})
         profiles = UserProfile.objects.all()
-        return Response(self.get_paginator(profiles, data))
+        number = int(data.get('page', 0))
+        per_page = settings.SEARCH_CACHE_PAGE_SIZE
+        facets = self.flag(data, 'facets')
+        cached = search_cache.cached_entry(profiles, query, facets)
+        ids = search_cache.page(profiles, query, cached, number, asker.account if asker else None)
+        if ids is not None:
+            found = profiles.in_bulk(ids)
+            result = {
+                'list': self.serializer([found[pk] for pk in ids if pk in found], many=True).data,
+                'pages': max(1, -(-cached['count'] // per_page))
+            }
+        else:
+            result = self.get_paginator(profiles, search_cache.search_kwargs(
+                dict(query, page=number, **({'asker': asker} if asker else {})), cached), count=per_page)
+        if facets:
+            result['facets'] = cached['facets']
+        return Response(result)
+
+    @staticmethod
+    def flag(data, key):
+        """Only 1 and true turn a flag on, the last one wins in lists"""
+        value = data.get(key)
+        if isinstance(value, (list, tuple)):
+            value = value[-1] if value else None
+        return str(value).lower() in ('1', 'true')
+
+    @staticmethod
+    def validate(query):
+        for key in ['min_free', 'consecutive']:
+            if key in query and not query[key].isdigit():
+                return 'Неверные данные'
+        try:
+            for day in [*query.get('days', []), *[query[key] for key in ['start', 'end'] if key in query]]:
+                datetime.strptime(day, date_format)
+        except ValueError:
+            return 'Неверный период'
+        return None
 
 
 class FavoritesView(ListView):
@@ -371,21 +448,30 @@ class FavoritesView(ListView):
         profiles = account.favorites.all()
         return Response(self.get_paginator(profiles, data))
 
+    def patch(self, request):
+        """Bulk update: {add: [profile ids], remove: [profile ids]}, returns ids of favorite profiles"""
+        account = Account.get(request.user)
+        return Response({'favorites': account.update_favorites(request.data.get('add') or [],
+                                                               request.data.get('remove') or [])})
+
 
 class CalendarView(APIView):
     permission_classes = ()
 
     def get(self, request):
+        """With since=<cursor> only changed dates are returned, the next cursor is in the X-Sync-Cursor header"""
         asker = UserProfile.get(request)
         start, end = request.GET.get('start'), request.GET.get('end')
         if start:
             start = datetime.strptime(start, date_format).date()
         if end:
             end = datetime.strptime(end, date_format).date()
+        cursor = Tombstone.cursor()
+        since = Tombstone.parse_cursor(request.GET.get('since'))
         result = {}
         if asker and request.GET.get('offers'):
-            result[asker.username] = asker.get_calendar(start=start, end=end, offers=True)
-            return Response(result)
+            result[asker.username] = asker.get_calendar(start=start, end=end, offers=True, since=since)
+            return sync_response(result, cursor)
         project_id = int(request.GET.get('project_id', 0))
         users = request.GET.getlist('users')
         if not users:
@@ -394,9 +480,74 @@ class CalendarView(APIView):
         for user in users:
             user_profile = UserProfile.get(user)
             if user_profile:
-                result[user] = user_profile.get_calendar(asker, start, end, project_id)
+                result[user] = user_profile.get_calendar(asker, start, end, project_id, since=since)
+
+        return sync_response(result, cursor)
+
+
+class CommonFreeDaysView(APIView):
+    permission_classes = ()
+    max_range = 366
+
+    def get(self, request):
+        users = request.GET.getlist('users') or request.GET.getlist('user')
+        try:
+            start = datetime.strptime(request.GET.get('start', ''), date_format).date()
+            end = datetime.strptime(request.GET.get('end', ''), date_format).date()
+        except ValueError:
+            return Response({'error': 'Неверный период'})
+        min_free = request.GET.get('min_free') or '0'
+        if not min_free.isdigit():
+            return Response({'error': 'Неверные данные'})
+        min_free = int(min_free)
+        if start > end or (end - start).days > self.max_range:
+            return Response({'error': 'Неверный период'})
+        ids = [int(user) for user in users if user.isdigit()]
+        usernames = [user for user in users if not user.isdigit()]
+        profiles = UserProfile.objects.filter(Q(id__in=ids) | Q(account__user__username__in=usernames))
+        if not users or not profiles.exists():
+            return Response({'error': 'Пользователи не найдены'})
+        days = profiles.common_free_days(start, end, min_free)
+        return Response({
+            'days': [date.strftime(date_format) for date in days],
+            'free': {date.strftime(date_format): count for date, count in days.items()}
+        })
 
-        return Response(result)
+
+class CalendarFeedView(APIView):
+    def get(self, request):
+        """Url of the ics feed, POST makes a new one and the old url stops working"""
+        profile = UserProfile.get(request)
+        return Response({'url': request.build_absolute_uri(f'{profile.calendar_feed_token()}.ics')})
+
+    def post(self, request):
+        profile = UserProfile.get(request)
+        return Response({'url': request.build_absolute_uri(f'{profile.calendar_feed_token(new=True)}.ics')})
+
+
+class CalendarFeedIcsView(APIView):
+    permission_classes = ()
+    authentication_classes = ()
+    period = 365
+
+    def get(self, request, token):
+        from api.ics import calendar
+        profile = UserProfile.objects.filter(calendar_token=token).select_related('account__user').first()
+        if not profile:
+            raise Http404
+        start = timezone.now().date() - timedelta(days=self.period)
+        updated = profile.calendar_updated
+        etag = quote_etag(f'{profile.id}-{updated.timestamp()}-{start}')
+        response = get_conditional_response(request, etag=etag, last_modified=int(updated.timestamp()))
+        if response:
+            return response
+
+        days = profile.calendar_days(start).select_related('project')
+        response = StreamingHttpResponse(calendar(profile, days, updated), content_type='text/calendar; charset=utf-8')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(updated.timestamp())
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
 
 class ProjectsView(ListView):
@@ -409,7 +560,12 @@ class ProjectsView(ListView):
             user = asker
         projects = user.projects(asker)
 
-        return Response(self.get_paginator(projects, data, asker=asker))
+        cursor = Tombstone.cursor()
+        since = Tombstone.parse_cursor(data.get('since'))
+        if since:
+            changed, deleted = asker.projects_changes(since)
+            return sync_response(self.get_delta(projects, data, changed, deleted, asker=asker), cursor)
+        return sync_response(self.get_paginator(projects, data, asker=asker), cursor)
 
 
 class OffersView(ListView):
@@ -418,7 +574,13 @@ class OffersView(ListView):
     def search(self, request, data):
         user = UserProfile.get(request)
         projects = user.offers()
-        return Response(self.get_paginator(projects, data, asker=user))
+
+        cursor = Tombstone.cursor()
+        since = Tombstone.parse_cursor(data.get('since'))
+        if since:
+            changed, deleted = user.projects_changes(since)
+            return sync_response(self.get_delta(projects, data, changed, deleted, asker=user), cursor)
+        return sync_response(self.get_paginator(projects, data, asker=user), cursor)
 
 
 class ProfileEditView(APIView):
@@ -529,9 +691,5 @@ class ProjectsStatisticsView(StatisticsView):
 class ProjectResponseView(APIView):
     def post(self, request, pk):
         profile = UserProfile.get(request)
-        response, created = ProjectShowing.objects.get_or_create(project_id=pk, user=profile, **request.data)
-        from django.utils import timezone
-        response.time = timezone.now()
-        response.response = True
-        response.save()
+        ProjectShowing.objects.respond(pk, profile.id, **request.data)
         return Response({})
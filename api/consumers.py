@@ -0,0 +1,39 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from api.events import group_name
+
+
+class EventsConsumer(AsyncJsonWebsocketConsumer):
+    """
+    ws/?token=<auth token>
+    Sends events of api.events.ProjectEvents to the profile of the token
+    """
+    group = None
+
+    async def connect(self):
+        profile_id = await self.get_profile_id()
+        if not profile_id:
+            await self.close()
+            return
+        self.group = group_name(profile_id)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if self.group:
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def project_event(self, event):
+        await self.send_json(event['data'])
+
+    @database_sync_to_async
+    def get_profile_id(self):
+        from rest_framework.authtoken.models import Token
+        query = parse_qs(self.scope['query_string'].decode())
+        key = query.get('token', [None])[0]
+        if not key:
+            return None
+        return Token.objects.filter(key=key).values_list('user__account__profile', flat=True).first()
@@ -0,0 +1,52 @@
+from django.db import transaction
+
+
+def group_name(profile_id):
+    return f'profile_{profile_id}'
+
+
+class ProjectEvents:
+    """
+    Push project events to websocket clients of the profile, see api.consumers.
+    The event only tells which project has changed, a client gets the changes with ?since=<cursor>
+    """
+    @classmethod
+    def send(cls, profile, event, project):
+        if not profile:
+            return
+        data = {
+            'event': event,
+            'project': {'id': project.id, 'title': str(project)},
+        }
+
+        def push():
+            try:
+                from asgiref.sync import async_to_sync
+                from channels.layers import get_channel_layer
+                async_to_sync(get_channel_layer().group_send)(group_name(profile.id), {
+                    'type': 'project.event',
+                    'data': data
+                })
+            except Exception as e:
+                print(e)
+        transaction.on_commit(push)
+
+    @classmethod
+    def create_project(cls, project):
+        cls.send(project.user, 'project.create', project)
+
+    @classmethod
+    def accept_project(cls, project):
+        cls.send(project.creator, 'project.accept', project)
+
+    @classmethod
+    def decline_project(cls, project):
+        cls.send(project.creator, 'project.decline', project)
+
+    @classmethod
+    def update_project(cls, project):
+        cls.send(project.user, 'project.update', project)
+
+    @classmethod
+    def cancel_project(cls, project):
+        cls.send(project.user, 'project.cancel', project)
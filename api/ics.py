@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+DATE_FORMAT = '%Y%m%d'
+DATETIME_FORMAT = '%Y%m%dT%H%M%SZ'
+
+
+def escape(text):
+    for char in ['\\', ';', ',']:
+        text = text.replace(char, '\\' + char)
+    return text.replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def fold(line):
+    """Split content line into 75 octets parts (RFC 5545, 3.1)"""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    while encoded:
+        size = 75 if not parts else 74
+        # do not split multibyte characters
+        while size < len(encoded) and (encoded[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(encoded[:size].decode())
+        encoded = encoded[size:]
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def event(uid, date, summary, stamp, description=None, tentative=False):
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}',
+        f'DTSTAMP:{stamp.strftime(DATETIME_FORMAT)}',
+        f'DTSTART;VALUE=DATE:{date.strftime(DATE_FORMAT)}',
+        f'DTEND;VALUE=DATE:{(date + timedelta(days=1)).strftime(DATE_FORMAT)}',
+        f'SUMMARY:{escape(summary)}',
+        f'STATUS:{"TENTATIVE" if tentative else "CONFIRMED"}',
+    ]
+    if description:
+        lines.append(f'DESCRIPTION:{escape(description)}')
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def calendar(profile, days, stamp):
+    """
+    Generator of an iCalendar feed, every day of a project is a separate all-day event.
+    stamp is the calendar version of the profile
+    """
+    yield ''.join(fold(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//DaysPick//Calendar//RU',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape(f"DaysPick: {profile.full_name}")}',
+        'X-PUBLISHED-TTL:PT1H',
+    ])
+    for day in days.iterator():
+        project = day.project
+        uid = f'{project.id}-{day.date.strftime(DATE_FORMAT)}@dayspick.ru'
+        if not project.creator_id:
+            yield event(uid, day.date, 'Выходной', stamp)
+        else:
+            yield event(uid, day.date, project.get_title(), stamp, description=day.info, tentative=project.is_wait)
+    yield 'END:VCALENDAR\r\n'
@@ -0,0 +1,67 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+SIZES = [64, 256, 1024]
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+
+
+def open_image(field_file):
+    from PIL import Image, ImageOps
+    with field_file.open('rb') as file:
+        image = Image.open(file)
+        image.load()
+    return ImageOps.exif_transpose(image)
+
+
+def encode(image, image_format):
+    buffer = BytesIO()
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.save(buffer, image_format, quality=85, optimize=image_format == 'JPEG')
+    return buffer.getvalue()
+
+
+def strip_metadata(field_file, image):
+    """Rewrite the original without EXIF and other metadata, field_file.name is set to the name given by the storage"""
+    image_format = {'jpeg': 'JPEG', 'jpg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP', 'gif': 'GIF'}.get(
+        field_file.name.rsplit('.', 1)[-1].lower(), 'JPEG')
+    content = encode(image, image_format)
+    default_storage.delete(field_file.name)
+    field_file.name = default_storage.save(field_file.name, ContentFile(content))
+
+
+def make_variants(field_file):
+    """
+    Strip metadata of the uploaded image and save its thumbnails, the stripped original may get a new name.
+    Returns {size: {format: name}}
+    """
+    from PIL import Image
+    image = open_image(field_file)
+    strip_metadata(field_file, image)
+    stem = os.path.splitext(field_file.name)[0]
+    variants = {}
+    for size in SIZES:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size), Image.LANCZOS)
+        variants[str(size)] = {}
+        for extension, image_format in FORMATS.items():
+            name = default_storage.save(f'{stem}_{size}.{extension}', ContentFile(encode(thumbnail, image_format)))
+            variants[str(size)][extension] = name
+    return variants
+
+
+def variant_names(variants):
+    return [name for formats in (variants or {}).values() for name in formats.values()]
+
+
+def variant_url(field_file, variants, size, extension='jpg'):
+    """Url of the smallest variant not less than size, the original until variants are made"""
+    if not field_file:
+        return None
+    for variant_size in sorted(int(key) for key in (variants or {})):
+        if variant_size >= size:
+            return default_storage.url(variants[str(variant_size)][extension])
+    return field_file.url
@@ -0,0 +1,101 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import transaction
+
+
+class BatchCommand(BaseCommand):
+    """
+    Base command for data backfills.
+    Walks get_queryset() by primary key in chunks, passes every chunk to process() and saves the returned objects
+    with bulk_update(update_fields). The last processed primary key is stored in a checkpoint file,
+    so an interrupted run continues with --resume.
+    """
+    chunk_size = 500
+    update_fields = []
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def process(self, objects):
+        """Change objects of the chunk and return those to be saved"""
+        raise NotImplementedError
+
+    @property
+    def name(self):
+        return self.__module__.split('.')[-1]
+
+    @property
+    def checkpoint(self):
+        return os.path.join(settings.BASE_DIR, '.checkpoints', f'{self.name}.json')
+
+    def load_checkpoint(self):
+        if not os.path.isfile(self.checkpoint):
+            return None
+        with open(self.checkpoint) as file:
+            return json.load(file).get('pk')
+
+    def save_checkpoint(self, pk):
+        os.makedirs(os.path.dirname(self.checkpoint), exist_ok=True)
+        with open(self.checkpoint, 'w') as file:
+            json.dump({'pk': pk}, file)
+
+    def clear_checkpoint(self):
+        if os.path.isfile(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        chunk_size = options['chunk_size'] or self.chunk_size
+        queryset = self.get_queryset().order_by('pk')
+        last = self.load_checkpoint() if options['resume'] else None
+        if last is not None:
+            queryset = queryset.filter(pk__gt=last)
+            print(f'Продолжение после pk={last}')
+        total = queryset.count()
+        done = changed = 0
+
+        while True:
+            chunk = list(queryset.filter(pk__gt=last)[:chunk_size] if last is not None else queryset[:chunk_size])
+            if not chunk:
+                break
+            with transaction.atomic():
+                objects = self.process(chunk) or []
+                if objects and self.update_fields and not self.dry_run:
+                    self.model.objects.bulk_update(objects, self.update_fields)
+            last = chunk[-1].pk
+            done += len(chunk)
+            changed += len(objects)
+            if not self.dry_run:
+                self.save_checkpoint(last)
+            print(f'{self.name}: {done}/{total}, изменено {changed}')
+
+        if not self.dry_run:
+            self.clear_checkpoint()
+        print(f'{self.name}: готово{" (dry run)" if self.dry_run else ""}')
+
+    @property
+    def model(self):
+        return self.get_queryset().model
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-c',
+            '--chunk-size',
+            action='store',
+            type=int,
+            default=None,
+            help=f'Количество объектов в пакете (по умолчанию {self.chunk_size})'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Не сохранять изменения'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Продолжить с последней сохраненной позиции'
+        )
@@ -1,13 +1,21 @@
-from django.core.management import BaseCommand
+from api.management.batch import BatchCommand
 
 
-class Command(BaseCommand):
+class Command(BatchCommand):
     help = 'Add start and end fields to project from dates'
+    update_fields = ['date_start', 'date_end', 'display_title']
 
-    def handle(self, *args, **kwargs):
+    def get_queryset(self):
+        from django.db.models import Min, Max
         from api.models import Project
-        test = Project.objects.all()
-        for project in test:
-            project.date_start = project.dates[0]
-            project.date_end = project.dates[-1]
-            project.save()
+        return Project.objects.select_related('parent').annotate(days_start=Min('days__date'), days_end=Max('days__date'))
+
+    def process(self, projects):
+        changed = []
+        for project in projects:
+            if project.days_start:
+                project.date_start = project.days_start
+                project.date_end = project.days_end
+                project.display_title = project.build_title()
+                changed.append(project)
+        return changed
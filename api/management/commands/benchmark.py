@@ -0,0 +1,298 @@
+import json
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from django.core.management import BaseCommand, CommandError
+
+
+def days(ctx, count=5):
+    return [(ctx['today'] + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(count)]
+
+
+CASES = [
+    ('login', 'post', '/api/login/', lambda ctx: {'username': ctx['asker'].username, 'password': 'qwerty'}),
+    ('login/telegram', 'post', '/api/login/telegram/', lambda ctx: {'id': ctx['asker'].account.telegram_chat_id}),
+    ('login/facebook', 'post', '/api/login/facebook/', lambda ctx: {
+        'id': 'benchmark', 'name': 'benchmark', 'picture': None, 'email': ctx['asker'].account.email_confirm}),
+    ('signup (check)', 'get', '/api/signup/', lambda ctx: {'username': ctx['asker'].username}),
+    ('confirm', 'get', '/api/confirm/', lambda ctx: {'user': ctx['asker'].username, 'code': 'wrong'}),
+    ('recovery', 'post', '/api/recovery/', lambda ctx: {'type': 'phone', 'value': ctx['asker'].account.phone_confirm}),
+    ('users', 'get', '/api/users/', None),
+    ('users (tags)', 'get', '/api/users/', lambda ctx: {'tags': ctx['tags']}),
+    ('users (facets)', 'get', '/api/users/', lambda ctx: {'tags': ctx['tags'], 'facets': 1}),
+    ('users (days)', 'post', '/api/users/', lambda ctx: {'days': days(ctx)}),
+    ('users (min_free)', 'post', '/api/users/', lambda ctx: {'days': days(ctx, 14), 'min_free': 10}),
+    ('users (consecutive)', 'post', '/api/users/', lambda ctx: {
+        'consecutive': 7, 'start': days(ctx, 1)[0], 'end': days(ctx, 60)[-1]}),
+    ('users (filter)', 'get', '/api/users/', lambda ctx: {'filter': ctx['other'].last_name}),
+    ('users (popular)', 'get', '/api/users/', {'order': 'popular'}),
+    ('tags', 'get', '/api/tags/', None),
+    ('profile/tags', 'get', '/api/profile/tags/', None),
+    ('profile/img', 'post', '/api/profile/img/', lambda ctx: {'avatar': ctx['image']()}),
+    ('profile', 'post', '/api/profile/', lambda ctx: {'info': 'benchmark'}),
+    ('account', 'get', '/api/account/', None),
+    ('daysoff', 'post', '/api/daysoff/', lambda ctx: {'pick': True, 'days': days(ctx, 14)}),
+    ('daysoff (range)', 'post', '/api/daysoff/', lambda ctx: {'pick': True, 'ranges': [{
+        'start': days(ctx, 1)[0], 'end': days(ctx, 365)[-1], 'weekdays': [6, 7]}]}),
+    ('calendar/offers', 'get', '/api/calendar/offers/', {'offers': 1}),
+    ('calendar', 'get', '/api/calendar/', lambda ctx: {'users': ctx['usernames']}),
+    ('calendar (since)', 'get', '/api/calendar/', lambda ctx: {'users': ctx['usernames'], 'since': ctx['since']}),
+    ('calendar/feed (ics)', 'get', lambda ctx: f'/api/calendar/feed/{ctx["asker"].calendar_feed_token()}.ics', None),
+    ('calendar/free', 'get', '/api/calendar/free/', lambda ctx: {
+        'users': ctx['crew'], 'start': days(ctx, 1)[0], 'end': days(ctx, 90)[-1], 'min_free': len(ctx['crew']) - 3}),
+    ('offers/statistics', 'post', '/api/offers/statistics/', None),
+    ('offers', 'get', '/api/offers/', None),
+    ('projects/statistics', 'post', '/api/projects/statistics/', None),
+    ('projects', 'get', '/api/projects/', None),
+    ('projects (since)', 'get', '/api/projects/', lambda ctx: {'since': ctx['since']}),
+    ('project/<pk>/response', 'post', lambda ctx: f'/api/project/{ctx["offer"].id}/response/', None),
+    ('project/<pk> (offer)', 'get', lambda ctx: f'/api/project/{ctx["offer"].id}/', None),
+    ('project/<pk>', 'get', lambda ctx: f'/api/project/{ctx["project"].id}/', None),
+    ('project (new)', 'get', '/api/project/', lambda ctx: {'user': ctx['other'].username}),
+    ('project (create)', 'post', '/api/project/', lambda ctx: {
+        'title': 'benchmark', 'user': ctx['asker'].id, 'days': {day: None for day in days(ctx, 3)}}),
+    ('clients/companies', 'get', '/api/clients/companies/', None),
+    ('clients', 'get', '/api/clients/', None),
+    ('client/<pk>', 'get', lambda ctx: f'/api/client/{ctx["client"].id}/', None),
+    ('client (create)', 'post', '/api/client/', {'name': 'benchmark', 'company': 'benchmark'}),
+    ('favorites', 'get', '/api/favorites/', None),
+    ('favorites (bulk)', 'patch', '/api/favorites/', lambda ctx: {'add': ctx['crew'], 'remove': [ctx['other'].id]}),
+    ('@<username>', 'get', lambda ctx: f'/api/@{ctx["other"].username}/', None),
+    ('', 'get', '/api/', None),
+]
+
+MULTIPART = {'profile/img'}
+
+
+class Command(BaseCommand):
+    help = 'Measure latency and query count of api endpoints on seeded datasets of several sizes'
+
+    def handle(self, *args, **options):
+        from django.db import transaction
+        from django.test.utils import override_settings
+
+        results = {}
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            for size in options['sizes']:
+                with transaction.atomic():
+                    ctx = self.setup(size, options['seed'])
+                    results[str(size)] = self.run(ctx, options)
+                    transaction.set_rollback(True)
+
+        self.report(results, options['sizes'])
+
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(results, file, indent=2, ensure_ascii=False)
+
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+            regressions = self.compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+            print('Регрессий не обнаружено')
+
+    def setup(self, size, seed):
+        from django.utils import timezone
+        from rest_framework.test import APIClient
+        from api.simulation import Simulator
+        from api.models import Project, Day, ProfileTag, Tombstone
+
+        profiles = Simulator(seed=seed, prefix=f'bench{seed}u').create(number=max(size, 2))
+        asker, other = profiles[0], profiles[1]
+        asker.account.telegram_chat_id = -1
+        asker.account.phone_confirm = 'benchmark'
+        asker.account.save()
+
+        today = timezone.now().date()
+        offer = Project.objects.create(creator=other, title='benchmark', date_start=today, date_end=today)
+        Day.objects.create(project=offer, date=today)
+        project = Project.objects.filter(user=asker, creator=asker).first() or \
+            Project.objects.create(user=asker, creator=asker, date_start=today, date_end=today)
+
+        client = APIClient()
+        client.force_authenticate(user=asker.account.user)
+
+        return {
+            'today': today,
+            'asker': asker,
+            'other': other,
+            'offer': offer,
+            'project': project,
+            'client': asker.clients.first() or asker.clients.create(name='benchmark'),
+            'http': client,
+            'usernames': [profile.username for profile in profiles[:10]],
+            'crew': [profile.id for profile in profiles[:40]],
+            'tags': list(ProfileTag.objects.values_list('tag_id', flat=True).distinct()[:2]),
+            'image': self.image,
+            'since': Tombstone.cursor(),
+        }
+
+    @staticmethod
+    def image():
+        from io import BytesIO
+        from PIL import Image
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        buffer = BytesIO()
+        Image.new('RGB', (512, 512), 'gray').save(buffer, 'JPEG')
+        return SimpleUploadedFile('benchmark.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def run(self, ctx, options):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        result = {}
+        for name, method, path, data in CASES:
+            if options['only'] and not any(pattern in name for pattern in options['only']):
+                continue
+            if any(pattern in name for pattern in options['skip']):
+                continue
+            path = path(ctx) if callable(path) else path
+            timings = []
+            queries = 0
+            for _ in range(options['repeat']):
+                params = data(ctx) if callable(data) else data
+                request = getattr(ctx['http'], method)
+                kwargs = {} if method == 'get' or name in MULTIPART else {'format': 'json'}
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    response = request(path, params, **kwargs)
+                    content = b''.join(response.streaming_content) if response.streaming else response.content
+                    timings.append((time.perf_counter() - start) * 1000)
+                queries = len(context.captured_queries)
+                if response.status_code >= 400:
+                    raise CommandError(f'{method.upper()} {path}: {response.status_code}')
+            result[name or '/'] = {
+                'ms': round(statistics.median(timings), 2),
+                'queries': queries,
+                'bytes': len(content),
+            }
+            if options['render'] and hasattr(response, 'data'):
+                result[name or '/']['render'] = self.render(response.data, options['repeat'])
+        return result
+
+    @staticmethod
+    def render(data, repeat):
+        """Render time of the default and orjson renderers and size of the compressed payload"""
+        from django.conf import settings
+        from django.utils.text import compress_string
+        from rest_framework.renderers import JSONRenderer
+        from api.middlewares import brotli
+        from api.renderers import FastJSONRenderer
+
+        result = {}
+        contents = []
+        for key, renderer in (('json', JSONRenderer()), ('orjson', FastJSONRenderer())):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                content = renderer.render(data)
+                timings.append((time.perf_counter() - start) * 1000)
+            result[f'{key}_ms'] = round(statistics.median(timings), 3)
+            contents.append(content)
+        result['identical'] = contents[0] == contents[1]
+        result['bytes'] = len(contents[0])
+        result['gzip'] = len(compress_string(contents[0]))
+        result['br'] = len(brotli.compress(contents[0], quality=settings.COMPRESSION_BROTLI_QUALITY)) if brotli else None
+        return result
+
+    @staticmethod
+    def report(results, sizes):
+        names = list(dict.fromkeys(name for result in results.values() for name in result))
+        width = max(len(name) for name in names) if names else 0
+        header = ''.join(f'{size:>24}' for size in sizes)
+        print(f'{"endpoint":<{width}}{header}')
+        for name in names:
+            line = ''
+            for size in sizes:
+                item = results[str(size)].get(name)
+                line += f'{item["ms"]:>13.2f} ms {item["queries"]:>5} q' if item else f'{"-":>24}'
+            print(f'{name:<{width}}{line}')
+
+        rendered = [(size, name, item['render']) for size in sizes for name, item in results[str(size)].items()
+                    if 'render' in item]
+        if not rendered:
+            return
+        print()
+        print(f'{"endpoint":<{width}}{"size":>7}{"json ms":>10}{"orjson ms":>11}{"bytes":>10}{"gzip":>9}{"br":>9}')
+        for size, name, item in rendered:
+            print(f'{name:<{width}}{size:>7}{item["json_ms"]:>10.3f}{item["orjson_ms"]:>11.3f}{item["bytes"]:>10}'
+                  f'{item["gzip"]:>9}{item["br"] or "-":>9}{"" if item["identical"] else "  (differs)"}')
+
+    @staticmethod
+    def compare(results, baseline, tolerance):
+        regressions = []
+        for size, result in results.items():
+            for name, item in result.items():
+                base = baseline.get(size, {}).get(name)
+                if not base:
+                    continue
+                if item['queries'] > base['queries']:
+                    regressions.append(f'[{size}] {name}: {base["queries"]} -> {item["queries"]} queries')
+                if item['ms'] > base['ms'] * (1 + tolerance):
+                    regressions.append(f'[{size}] {name}: {base["ms"]} -> {item["ms"]} ms')
+        return regressions
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=[10, 100, 1000],
+            help='Количество пользователей в наборах данных'
+        )
+        parser.add_argument(
+            '-s',
+            '--seed',
+            action='store',
+            type=int,
+            default=0,
+            help='Seed генератора случайных чисел'
+        )
+        parser.add_argument(
+            '-r',
+            '--repeat',
+            action='store',
+            type=int,
+            default=5,
+            help='Количество повторов каждого запроса'
+        )
+        parser.add_argument(
+            '--only',
+            nargs='+',
+            default=[],
+            help='Запускать только эндпоинты, содержащие указанные строки'
+        )
+        parser.add_argument(
+            '--skip',
+            nargs='+',
+            default=[],
+            help='Пропустить эндпоинты, содержащие указанные строки (например, "filter" без доступа к Яндекс.Спеллеру)'
+        )
+        parser.add_argument(
+            '--render',
+            action='store_true',
+            help='Замерить время рендеринга JSON и размер сжатых ответов'
+        )
+        parser.add_argument(
+            '--save',
+            action='store',
+            default=None,
+            help='Сохранить результаты в JSON файл'
+        )
+        parser.add_argument(
+            '--baseline',
+            action='store',
+            default=None,
+            help='JSON файл с предыдущими результатами для сравнения'
+        )
+        parser.add_argument(
+            '--tolerance',
+            action='store',
+            type=float,
+            default=0.2,
+            help='Допустимое относительное увеличение времени ответа'
+        )
@@ -16,6 +16,8 @@ class Command(BaseCommand):
                 n = int(options.get('number'))
             except:
                 n = 1
+            if options.get('bulk'):
+                return create_bulk(n, options.get('seed'))
             for i in range(n):
                 account = Account.create(password='qwerty')
                 account.update(email_confirm=f'{account.username}@dayspick.ru')
@@ -46,6 +48,27 @@ class Command(BaseCommand):
             default=1,
             help='Количество новых пользователей'
         )
+        parser.add_argument(
+            '-b',
+            '--bulk',
+            action='store_true',
+            help='Создать пользователей пакетно, без сети и уведомлений'
+        )
+        parser.add_argument(
+            '-s',
+            '--seed',
+            action='store',
+            type=int,
+            default=None,
+            help='Seed генератора случайных чисел для пакетного режима'
+        )
+
+
+def create_bulk(n, seed=None):
+    from api.simulation import Simulator
+    simulator = Simulator(seed=seed, prefix='sim' if seed is None else f'sim{seed}u', period=(0, 60))
+    profiles = simulator.create(number=n, days_off=(0, 0), clients=(0, 0), offers=0, series=0)
+    print(f'Создано пользователей: {len(profiles)}')
 
 
 def create_random_projects(profile):
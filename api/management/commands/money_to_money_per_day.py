@@ -1,14 +1,20 @@
-from django.core.management import BaseCommand
+from api.management.batch import BatchCommand
 
 
-class Command(BaseCommand):
+class Command(BatchCommand):
     help = 'Add money per day field from money field'
+    update_fields = ['money_per_day']
 
-    def handle(self, *args, **kwargs):
+    def get_queryset(self):
+        from django.db.models import Count
         from api.models import Project
-        projects = Project.objects.all()
+        return Project.objects.filter(money__isnull=False).annotate(days_count=Count('days'))
+
+    def process(self, projects):
+        changed = []
         for project in projects:
-            if project.money:
-                project.money_per_day = project.money / project.days.count()
-                project.save()
-                print(f'Project {project.id}: {project.money} / {project.days.count()} = {project.money_per_day}')
+            if project.money and project.days_count:
+                project.money_per_day = project.money / project.days_count
+                changed.append(project)
+                print(f'Project {project.id}: {project.money} / {project.days_count} = {project.money_per_day}')
+        return changed
@@ -1,11 +1,24 @@
-from django.core.management import BaseCommand
+from api.management.batch import BatchCommand
 
 
-class Command(BaseCommand):
+class Command(BatchCommand):
     help = 'Add start and end fields to project from dates'
+    update_fields = ['date_start', 'date_end', 'display_title']
 
-    def handle(self, *args, **kwargs):
+    def get_queryset(self):
+        from django.db.models import Min, Max
         from api.models import Project
-        test = Project.objects.all().folders()
-        for project in test:
-            project.parent_days_set()
+        return Project.objects.filter(is_series=True).select_related('parent').annotate(
+            days_start=Min('children__days__date'),
+            days_end=Max('children__days__date')
+        )
+
+    def process(self, projects):
+        changed = []
+        for project in projects:
+            if project.days_start:
+                project.date_start = project.days_start
+                project.date_end = project.days_end
+                project.display_title = project.build_title()
+                changed.append(project)
+        return changed
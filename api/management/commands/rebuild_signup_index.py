@@ -0,0 +1,12 @@
+from django.core.management import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Rebuild Redis sets of taken usernames, emails and phones used by signup validation'
+
+    def handle(self, *args, **options):
+        from api.signup import rebuild
+        if rebuild():
+            print('Индекс регистрации обновлён')
+        else:
+            print('Индекс регистрации не обновлён, проверки идут в базу')
@@ -0,0 +1,58 @@
+from django.core.management import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Seed database with offline deterministic simulated data'
+
+    def handle(self, *args, **options):
+        from api.simulation import Simulator
+        from api.models import Project, Day
+        simulator = Simulator(seed=options['seed'])
+        profiles = simulator.create(
+            number=options['number'],
+            projects=(options['projects_min'], options['projects_max']),
+            days_off=(0, options['days_off'])
+        )
+        ids = [profile.id for profile in profiles]
+        projects = Project.objects.filter(user_id__in=ids).count()
+        days = Day.objects.filter(project__user_id__in=ids).count()
+        print(f'Создано пользователей: {len(profiles)}, проектов: {projects}, дней: {days}')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n',
+            '--number',
+            action='store',
+            type=int,
+            default=100,
+            help='Количество новых пользователей'
+        )
+        parser.add_argument(
+            '-s',
+            '--seed',
+            action='store',
+            type=int,
+            default=0,
+            help='Seed генератора случайных чисел'
+        )
+        parser.add_argument(
+            '--projects-min',
+            action='store',
+            type=int,
+            default=1,
+            help='Минимальное количество проектов на пользователя'
+        )
+        parser.add_argument(
+            '--projects-max',
+            action='store',
+            type=int,
+            default=10,
+            help='Максимальное количество проектов на пользователя'
+        )
+        parser.add_argument(
+            '--days-off',
+            action='store',
+            type=int,
+            default=10,
+            help='Максимальное количество выходных на пользователя'
+        )
@@ -0,0 +1,107 @@
+import os
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, Http404
+from django.utils._os import safe_join
+from django.views.static import serve as static_serve
+
+DELETION_QUEUE = 'media:delete'
+
+
+def serve(request, path):
+    """
+    Local media view. With MEDIA_ACCEL the file is sent by the web server, the worker only returns headers.
+    Without it files are served by django only with DEBUG
+    """
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if settings.MEDIA_ACCEL == 'x-accel-redirect':
+        response = HttpResponse(content_type='')
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + path
+    elif settings.MEDIA_ACCEL == 'x-sendfile':
+        if not os.path.isfile(fullpath):
+            raise Http404
+        response = HttpResponse(content_type='')
+        response['X-Sendfile'] = fullpath
+    elif settings.DEBUG:
+        response = static_serve(request, path, document_root=settings.MEDIA_ROOT)
+    else:
+        raise Http404
+    response['Cache-Control'] = settings.MEDIA_CACHE_CONTROL
+    return response
+
+
+def url_patterns():
+    """Local media route, in production it needs MEDIA_ACCEL, otherwise media is left to the web server"""
+    from django.urls import re_path
+    if settings.MEDIA_STORAGE != 'local' or not (settings.MEDIA_ACCEL or settings.DEBUG):
+        return []
+    return [re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve)]
+
+
+try:
+    from storages.backends.s3boto3 import S3Boto3Storage
+except ImportError:
+    S3Boto3Storage = None
+
+if S3Boto3Storage:
+    class S3MediaStorage(S3Boto3Storage):
+        """
+        S3-compatible storage. Signed urls are cached for most of their lifetime,
+        so the same url is returned for a file and browsers can cache it
+        """
+        def url(self, name, parameters=None, expire=None, http_method=None):
+            if parameters or expire or http_method:
+                return super().url(name, parameters, expire, http_method)
+            from django.core.cache import cache
+            key = f'media:url:{name}'
+            url = cache.get(key)
+            if not url:
+                url = super().url(name)
+                cache.set(key, url, settings.AWS_QUERYSTRING_EXPIRE * 3 // 4)
+            return url
+
+        def delete(self, name):
+            from django.core.cache import cache
+            cache.delete(f'media:url:{name}')
+            super().delete(name)
+
+
+def queue_deletion(names):
+    """Queue media files for removal by the delete_queued_media task"""
+    names = [name for name in names if name]
+    if not names:
+        return
+    try:
+        from django_redis import get_redis_connection
+        get_redis_connection('default').sadd(DELETION_QUEUE, *names)
+    except Exception as e:
+        print(e)
+        delete(names)
+
+
+def delete(names):
+    """Delete files skipping missing ones"""
+    deleted = 0
+    for name in names:
+        try:
+            default_storage.delete(name)
+            deleted += 1
+        except Exception as e:
+            print(f'Media {name} was not deleted: {e}')
+    return deleted
+
+
+def delete_queued(batch=500):
+    from django_redis import get_redis_connection
+    connection = get_redis_connection('default')
+    deleted = 0
+    while True:
+        names = [name.decode() for name in connection.spop(DELETION_QUEUE, batch)]
+        if not names:
+            return deleted
+        deleted += delete(names)
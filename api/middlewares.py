@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_sequence, compress_string
 from rest_framework.authtoken.models import Token
 from re import sub
 
@@ -18,3 +22,57 @@ from api.models import UserProfile
 #                     profile.update(last_activity=timezone.now())
 #             except Token.DoesNotExist:
 #                 pass
+
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accepts_gzip = _lazy_re_compile(r'\bgzip\b')
+re_accepts_brotli = _lazy_re_compile(r'\bbr\b')
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Brotli or gzip compression of text responses larger than COMPRESSION_MIN_LENGTH.
+    Brotli is used when the package is installed and the client accepts it, streaming responses are gzipped
+    """
+    compressible = ('text/', 'application/json')
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        if not response.get('Content-Type', '').startswith(self.compressible):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_LENGTH:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accept = request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+        if response.streaming:
+            if not re_accepts_gzip.search(accept):
+                return response
+            response.streaming_content = compress_sequence(response.streaming_content)
+            encoding = 'gzip'
+            del response['Content-Length']
+        else:
+            if brotli and re_accepts_brotli.search(accept):
+                content = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+                encoding = 'br'
+            elif re_accepts_gzip.search(accept):
+                content = compress_string(response.content)
+                encoding = 'gzip'
+            else:
+                return response
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # the entity is not byte-for-byte the same anymore, see django.middleware.gzip
+        if response.has_header('ETag'):
+            response['ETag'] = sub(r'^"', 'W/"', response['ETag'])
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.1 on 2026-10-19 17:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0120_auto_20211001_1423'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'DELETE FROM api_day a USING api_day b '
+            'WHERE a.project_id = b.project_id AND a.date = b.date AND a.id > b.id',
+            migrations.RunSQL.noop
+        ),
+        migrations.AddConstraint(
+            model_name='day',
+            constraint=models.UniqueConstraint(fields=('project', 'date'), name='unique_day_project_date'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.1 on 2026-10-19 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0121_day_unique_project_date'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(condition=models.Q(is_wait=False), fields=['user'], name='project_user_busy'),
+        ),
+    ]
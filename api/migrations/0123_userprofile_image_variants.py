@@ -0,0 +1,23 @@
+# Generated by Django 3.1.1 on 2026-10-19 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0122_project_user_busy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.1 on 2026-10-19 18:08
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0123_userprofile_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='calendar_token',
+            field=models.CharField(blank=True, max_length=32, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='calendar_updated',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.1.1 on 2026-10-19 18:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0124_userprofile_calendar_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=16)),
+                ('object_id', models.IntegerField()),
+                ('user_id', models.IntegerField(blank=True, null=True)),
+                ('creator_id', models.IntegerField(blank=True, null=True)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('deleted', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['deleted'],
+            },
+        ),
+        migrations.AddField(
+            model_name='day',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='projectshowing',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.1 on 2026-10-19 18:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0125_delta_sync'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='day',
+            options={'ordering': ['date', 'project__date_start', 'project__date_end', 'project_id']},
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+def make_title(title, date_start, date_end, parent_title):
+    title = title or ''
+    if not title and date_start and date_end:
+        start = date_start.strftime('%d.%m.%y')
+        end = date_end.strftime('%d.%m.%y')
+        title = start
+        if end != start:
+            title += ' - ' + end
+    if parent_title is not None:
+        title = parent_title + ' / ' + title
+    return title
+
+
+def set_display_titles(apps, schema_editor):
+    Project = apps.get_model('api', 'Project')
+    projects = []
+    for project in Project.objects.select_related('parent').iterator():
+        if not project.creator_id:
+            project.display_title = '*days_off*'
+        else:
+            parent_title = project.parent.title if project.parent_id else None
+            project.display_title = make_title(project.title, project.date_start, project.date_end, parent_title)
+        projects.append(project)
+        if len(projects) == 1000:
+            Project.objects.bulk_update(projects, ['display_title'])
+            projects = []
+    Project.objects.bulk_update(projects, ['display_title'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0126_day_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='display_title',
+            field=models.CharField(blank=True, default='', max_length=160),
+        ),
+        migrations.RunPython(set_display_titles, migrations.RunPython.noop),
+        TrigramExtension(),
+        # search filters with display_title__icontains, which django compiles to UPPER(display_title) LIKE
+        migrations.RunSQL(
+            'CREATE INDEX project_display_title_trgm ON api_project USING gin (UPPER(display_title) gin_trgm_ops)',
+            'DROP INDEX project_display_title_trgm'
+        ),
+    ]
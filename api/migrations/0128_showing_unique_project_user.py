@@ -0,0 +1,29 @@
+# Generated by Django 3.1.1 on 2026-10-19 18:18
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0127_project_display_title'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'DELETE FROM api_projectshowing a USING api_projectshowing b '
+            'WHERE a.project_id = b.project_id AND a.user_id = b.user_id '
+            'AND (a.response < b.response OR (a.response = b.response AND a.id > b.id))',
+            migrations.RunSQL.noop
+        ),
+        migrations.AlterField(
+            model_name='projectshowing',
+            name='time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddConstraint(
+            model_name='projectshowing',
+            constraint=models.UniqueConstraint(fields=('project', 'user'), name='unique_showing_project_user'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.1 on 2026-10-19 18:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0128_showing_unique_project_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectStatistics',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='api.project')),
+                ('views', models.IntegerField(default=0)),
+                ('responses', models.IntegerField(default=0)),
+                ('viewers', models.IntegerField(default=0)),
+                ('viewers_hll', models.BinaryField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.1 on 2026-10-19 18:24
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0129_project_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.RunSQL(
+            'UPDATE api_account SET created = auth_user.date_joined FROM auth_user WHERE auth_user.id = api_account.user_id',
+            migrations.RunSQL.noop
+        ),
+    ]
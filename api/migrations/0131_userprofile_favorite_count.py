@@ -0,0 +1,24 @@
+# Generated by Django 3.1.1 on 2026-10-19 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0130_account_created'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='favorite_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            'UPDATE api_userprofile SET favorite_count = favorites.count FROM ('
+            'SELECT userprofile_id, COUNT(*) AS count FROM api_account_favorites GROUP BY userprofile_id'
+            ') favorites WHERE favorites.userprofile_id = api_userprofile.id',
+            migrations.RunSQL.noop
+        ),
+    ]
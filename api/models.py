@@ -4,9 +4,12 @@ from datetime import datetime, timedelta
 from functools import reduce
 
 from django.contrib.auth.models import User, AbstractUser
+from django.conf import settings
 from django.contrib.postgres.search import SearchRank, SearchVector
-from django.db import models, OperationalError
-from django.db.models import Q, Count, F, Case, When, BooleanField
+from django.core.cache import cache
+from django.db import models, connection, OperationalError
+from django.db.models import Q, Count, F, Exists, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from pyaspeller.yandex_speller import YandexSpeller
 
@@ -15,6 +18,34 @@ from api.mail import Mail
 null = {'null': True, 'blank': True}
 
 
+class TrackedFieldsMixin:
+    """Remembers values of tracked_fields loaded from the database, so changes are known without a query"""
+    tracked_fields = []
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_values = {
+            name: value or None for name, value in zip(field_names, values) if name in cls.tracked_fields
+        }
+        return instance
+
+    def tracked_value(self, field):
+        value = getattr(self, field)
+        return getattr(value, 'name', value) or None
+
+    def loaded(self, field):
+        return getattr(self, 'loaded_values', {}).get(field)
+
+    def is_changed(self, field):
+        loaded_values = getattr(self, 'loaded_values', {})
+        return field in loaded_values and loaded_values[field] != self.tracked_value(field)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.loaded_values = {field: self.tracked_value(field) for field in self.tracked_fields}
+
+
 class Tag(models.Model):
     title = models.CharField(max_length=64)
     default = models.BooleanField(default=False)
@@ -72,6 +103,9 @@ class ProfileTagManager(models.Manager):
         self.set(tags)
         ProfileTag.objects.filter(user__isnull=True).delete()
         Tag.objects.filter(profile_tags__user__isnull=True).exclude(default=True).delete()
+        from django.db import transaction
+        from api import search_cache
+        transaction.on_commit(search_cache.bump)
         return self.list()
 
 
@@ -134,7 +168,109 @@ class ClientsManager(models.Manager):
         return clients
 
 
-class Account(models.Model):
+class AccountManager(models.Manager):
+    @staticmethod
+    def profile_ids(number):
+        """Take ids for new profiles from the sequence, so usernames can be set before the profiles are created"""
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT nextval(pg_get_serial_sequence('{UserProfile._meta.db_table}', 'id')) "
+                           f"FROM generate_series(1, %s)", [number])
+            return [row[0] for row in cursor.fetchall()]
+
+    def create_accounts(self, items, notify=True):
+        """
+        Create users, accounts and profiles for the list of Account.create arguments in one transaction
+        with a query per table. Admin notification and confirmation emails are sent after commit.
+        Returns the list of accounts
+        """
+        from django.contrib.auth.hashers import make_password
+        from django.db import transaction
+        items = [dict(data) for data in items]
+        if not items:
+            return []
+        with transaction.atomic():
+            ids = self.profile_ids(len(items))
+            users = []
+            names = []
+            for profile_id, data in zip(ids, items):
+                username = data.pop('username', None) or str(profile_id)
+                password = data.pop('password', None) or uuid.uuid4().hex
+                data.pop('password2', None)
+                names.append((data.pop('first_name', None), data.pop('last_name', None)))
+                users.append(User(username=username, password=make_password(password)))
+            users = User.objects.bulk_create(users)
+
+            accounts = [self.model(user=user, **data) for user, data in zip(users, items)]
+            for account in accounts:
+                account.is_public = account.is_confirmed
+            accounts = self.bulk_create(accounts)
+
+            profiles = UserProfile.objects.bulk_create([
+                UserProfile(id=profile_id, account=account, first_name=first_name, last_name=last_name)
+                for profile_id, account, (first_name, last_name) in zip(ids, accounts, names)
+            ])
+            for account, profile in zip(accounts, profiles):
+                account.profile = profile
+                account.loaded_values = {field: account.tracked_value(field) for field in Account.tracked_fields}
+
+            transaction.on_commit(lambda: self.after_create(accounts, notify))
+        return accounts
+
+    @staticmethod
+    def after_create(accounts, notify=True):
+        from api import signup, search_cache
+        if any(account.is_public for account in accounts):
+            search_cache.bump()
+        signup.add('username', *[account.username for account in accounts])
+        signup.add('email', *[account.email_confirm for account in accounts if account.email_confirm])
+        signup.add('phone', *[account.phone_confirm for account in accounts if account.phone_confirm])
+        if notify:
+            from api.tasks import bot_admin_notification
+            usernames = ', '.join(account.username for account in accounts)
+            try:
+                bot_admin_notification.delay(f'Аккаунт создан.\nusername: {usernames}')
+            except Exception as e:
+                print(e)
+            for account in accounts:
+                if account.email:
+                    account.send_confirmation_email()
+
+    def unconfirmed(self, age=timedelta(minutes=30)):
+        """Accounts without confirmed email, phone and telegram created more than age ago"""
+        return self.filter(created__lt=timezone.now() - age, email_confirm__isnull=True, phone_confirm__isnull=True,
+                           telegram_chat_id__isnull=True)
+
+    def delete_unconfirmed(self, age=timedelta(minutes=30)):
+        """
+        Delete expired unconfirmed accounts with their users in a few queries. Profiles are kept without account,
+        as Account.delete does, their images are queued for deletion. Returns usernames of deleted accounts
+        """
+        from django.db import transaction
+        from api.images import variant_names
+        from api.media import queue_deletion
+        with transaction.atomic():
+            accounts = dict(self.unconfirmed(age).select_for_update(skip_locked=True).values_list('pk', 'user__username'))
+            if not accounts:
+                return []
+            ids = list(accounts)
+            profiles = UserProfile.objects.filter(account_id__in=ids)
+            names = []
+            for profile in profiles.values('avatar', 'photo', 'avatar_variants', 'photo_variants'):
+                names += [profile['avatar'], profile['photo']]
+                names += variant_names(profile['avatar_variants']) + variant_names(profile['photo_variants'])
+            profiles.update(account=None, avatar=None, photo=None, avatar_variants={}, photo_variants={})
+            favorites = self.model.favorites.through.objects.filter(account_id__in=ids)
+            favorite_ids = set(favorites.values_list('userprofile_id', flat=True))
+            favorites.delete()
+            UserProfile.objects.filter(pk__in=favorite_ids).count_favorites()
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {self.model._meta.db_table} WHERE user_id = ANY(%s)', [ids])
+            User.objects.filter(pk__in=ids).delete()
+            transaction.on_commit(lambda: queue_deletion(names))
+        return list(accounts.values())
+
+
+class Account(TrackedFieldsMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='account', primary_key=True)
     email = models.EmailField(**null)
     email_confirm = models.EmailField(**null, unique=True)
@@ -145,10 +281,15 @@ class Account(models.Model):
                                             related_name='account')
     is_public = models.BooleanField(default=False)
     raised = models.DateTimeField(default=timezone.now)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
     favorites = models.ManyToManyField('UserProfile', related_name='favorite_of', blank=True)
 
     telegram_notifications = models.BooleanField(default=False)
 
+    objects = AccountManager()
+
+    tracked_fields = ['email_confirm', 'phone_confirm', 'is_public', 'raised']
+
     @property
     def can_be_raised(self):
         delta = timezone.now() - self.raised
@@ -172,6 +313,31 @@ class Account(models.Model):
             token = Token.objects.create(user=self.user)
         return token.key
 
+    def signer(self, purpose):
+        """
+        Signer of email codes. The salt depends on the password and the addresses,
+        so a code stops working after the password is changed or the email is confirmed.
+        Recovery codes also depend on last_login, which is updated by recovery, so each works once
+        """
+        from django.core.signing import TimestampSigner
+        salt = f'api.Account.{purpose}:{self.user.password}:{self.email}:{self.email_confirm}'
+        if purpose == 'recovery':
+            salt += f':{self.user.last_login.timestamp() if self.user.last_login else ""}'
+        return TimestampSigner(salt=salt)
+
+    def make_code(self, purpose):
+        return self.signer(purpose).sign(str(self.pk)).split(':', 1)[1]
+
+    def check_code(self, purpose, code):
+        from django.core.signing import BadSignature
+        if not code:
+            return False
+        try:
+            self.signer(purpose).unsign(f'{self.pk}:{code}', max_age=settings.EMAIL_CODE_MAX_AGE)
+        except BadSignature:
+            return False
+        return True
+
     @classmethod
     def get(cls, username, alt=None):
         if not username:
@@ -187,25 +353,11 @@ class Account(models.Model):
             params = {'profile__id': int(username)}
         else:
             params = {'user__username': username}
-        return cls.objects.filter(**params).first() or alt
+        return cls.objects.select_related('user').filter(**params).first() or alt
 
     @classmethod
     def create(cls, **data):
-        username = data.pop('username', None)
-        password = data.pop('password', uuid.uuid4().hex)
-        data.pop('password2', None)
-        user = User.objects.create_user(username=username or f'u{uuid.uuid4().hex[:16]}', password=password)
-        first_name = data.pop('first_name')
-        last_name = data.pop('last_name')
-        account = cls.objects.create(user=user, **data)
-        UserProfile.objects.create(account=account, first_name=first_name, last_name=last_name)
-        if not username:
-            account.update(username=str(account.profile.id))
-        from api.bot import BotNotification
-        BotNotification.send_to_admins(f'Аккаунт создан.\nusername: {account.username}')
-        if account and account.email:
-            account.send_confirmation_email()
-        return account
+        return cls.objects.create_accounts([data])[0]
 
     def update(self, **data):
         for key, value in data.items():
@@ -213,7 +365,7 @@ class Account(models.Model):
                 profile = UserProfile.get(value)
                 if not profile:
                     continue
-                if self.favorites.filter(id=value):
+                if self.favorites.filter(id=profile.id).exists():
                     self.favorites.remove(profile)
                 else:
                     self.favorites.add(profile)
@@ -258,8 +410,20 @@ class Account(models.Model):
         self.save()
         return self
 
+    def update_favorites(self, add=(), remove=()):
+        """Add and remove favorite profiles by ids, unknown ids and own profile are skipped. Returns favorite ids"""
+        ids = {int(pk) for pk in [*add, *remove] if str(pk).isdigit()}
+        ids = set(UserProfile.objects.filter(pk__in=ids).exclude(account=self).values_list('pk', flat=True))
+        add = ids & {int(pk) for pk in add if str(pk).isdigit()}
+        remove = ids & {int(pk) for pk in remove if str(pk).isdigit()} - add
+        if add:
+            self.favorites.add(*add)
+        if remove:
+            self.favorites.remove(*remove)
+        return list(self.favorites.values_list('id', flat=True))
+
     def send_confirmation_email(self):
-        code = self.token(new=True)[6:]
+        code = self.make_code('confirm')
         print('send', self.email, code)
         letter = {
             'theme': 'Подтверждение адреса электронной почты',
@@ -271,14 +435,13 @@ class Account(models.Model):
         print(f'https://dayspick.ru/confirm/?user={self.username}&code={code}')
 
     def confirm_email(self, code):
-        if code == self.token()[6:]:
+        if self.email and self.check_code('confirm', code):
             self.update(email_confirm=self.email, email=None)
-            self.token(new=True)
             return True
         return False
 
     def send_recovery_email(self):
-        code = self.token(new=True)[6:]
+        code = self.make_code('recovery')
         letter = {
             'theme': 'Восстановление доступа к аккаунту',
             'body': f'Для восстановления досутпа к аккаунту {self.username} перейди по ссылке: '
@@ -295,9 +458,97 @@ class Account(models.Model):
         return self.username
 
 
+class FreeStreak(models.Func):
+    """Longest run of consecutive days in [start, end] on which the profile has no confirmed projects"""
+    output_field = IntegerField()
+
+    def __init__(self, profile, start, end):
+        super().__init__(profile)
+        self.start, self.end = start, end
+
+    def as_sql(self, compiler, connection, **extra_context):
+        profile, params = compiler.compile(self.get_source_expressions()[0])
+        sql = f'''(
+            SELECT COALESCE(MAX(gaps.gap), 0) FROM (
+                SELECT COALESCE(LEAD(busy.date) OVER (ORDER BY busy.date), %s::date + 1) - busy.date - 1 AS gap
+                FROM (
+                    SELECT %s::date - 1 AS date
+                    UNION
+                    SELECT day.date FROM {Day._meta.db_table} day
+                    JOIN {Project._meta.db_table} project ON project.id = day.project_id
+                    WHERE project.user_id = {profile} AND NOT project.is_wait AND day.date BETWEEN %s AND %s
+                ) busy
+            ) gaps
+        )'''
+        return sql, [self.end, self.start, *params, self.start, self.end]
+
+
 class UserProfileQuerySet(models.QuerySet):
+    def busy_days(self, **filters):
+        """Days of confirmed projects of the outer profile"""
+        return Day.objects.filter(project__user=OuterRef('pk'), project__is_wait=False, **filters)
+
+    def count_favorites(self):
+        """Recount favorite_count of profiles from the favorites table"""
+        count = Account.favorites.through.objects.filter(userprofile=OuterRef('pk')).order_by() \
+            .values('userprofile').annotate(count=Count('*')).values('count')
+        return self.update(favorite_count=Coalesce(Subquery(count, output_field=IntegerField()), 0))
+
+    def touch_calendar(self):
+        """Bump calendar version of profiles, it is used for ETag and Last-Modified of the ics feed"""
+        return self.update(calendar_updated=timezone.now())
+
+    def available(self, dates, min_free=None):
+        """
+        Profiles free on all of the dates or, with min_free, on at least min_free of them.
+        free_days is annotated with the number of free dates
+        """
+        dates = set(dates)
+        if not min_free or min_free >= len(dates):
+            return self.annotate(free_days=models.Value(len(dates), IntegerField())).exclude(
+                Exists(self.busy_days(date__in=dates)))
+        busy = self.busy_days(date__in=dates).order_by().values('project__user').annotate(
+            count=Count('date', distinct=True)).values('count')
+        return self.annotate(free_days=len(dates) - Coalesce(Subquery(busy, output_field=IntegerField()), 0)).filter(
+            free_days__gte=min_free)
+
+    def available_in_row(self, length, start, end):
+        """Profiles free for at least length consecutive days between start and end"""
+        return self.annotate(free_streak=FreeStreak(F('pk'), start, end)).filter(free_streak__gte=length)
+
+    def common_free_days(self, start, end, min_free=None):
+        """
+        Days between start and end on which all profiles of the queryset or, with min_free, at least min_free of them
+        are free. Returns {date: number of free profiles}
+        """
+        from django.contrib.postgres.aggregates import ArrayAgg
+        length = (end - start).days + 1
+        profiles = list(self.values_list('pk', flat=True))
+        busy = Day.objects.filter(project__user__in=profiles, project__is_wait=False, date__range=[start, end]) \
+            .order_by().values('project__user').annotate(dates=ArrayAgg('date', distinct=True))
+
+        if not min_free or min_free >= len(profiles):
+            mask = 0
+            for item in busy:
+                for date in item['dates']:
+                    mask |= 1 << (date - start).days
+            return {start + timedelta(days=i): len(profiles) for i in range(length) if not mask >> i & 1}
+
+        free = [len(profiles)] * length
+        for item in busy:
+            for date in item['dates']:
+                free[(date - start).days] -= 1
+        return {start + timedelta(days=i): count for i, count in enumerate(free) if count >= min_free}
+
+    @staticmethod
+    def spell(search):
+        try:
+            return YandexSpeller().spelled(search)
+        except:
+            return search
+
     def search(self, **kwargs):
-        users = self.exclude(account__isnull=True).exclude(account__is_public=False).order_by('-account__raised')
+        users = self.exclude(account__isnull=True).exclude(account__is_public=False).order_by('-account__raised', 'id')
 
         if not kwargs:
             return users
@@ -305,23 +556,28 @@ class UserProfileQuerySet(models.QuerySet):
         ordering = []
 
         if kwargs.get('asker'):
-            users = users.annotate(is_favorite=Case(
-                When(favorite_of__profile=kwargs['asker'], then=True),
-                default=False,
-                output_field=BooleanField()
-            ))
+            users = users.annotate(is_favorite=Exists(Account.favorites.through.objects.filter(
+                account_id=kwargs['asker'].account_id, userprofile_id=OuterRef('pk'))))
             ordering.append('-is_favorite')
 
+        order = kwargs.get('order')
+        if isinstance(order, list):
+            order = order[0]
+        if order == 'popular':
+            ordering.append('-favorite_count')
+
         if kwargs.get('exclude'):
             pk = kwargs['exclude']
             users = users.exclude(pk=pk)
 
         if kwargs.get('tags'):
-            users = users.filter(tags__tag_id__in=kwargs['tags'])
-            ordering.append('tags__rank')
+            matching = ProfileTag.objects.filter(user=OuterRef('pk'), tag_id__in=kwargs['tags'])
+            users = users.filter(Exists(matching)).annotate(
+                tag_rank=Subquery(matching.order_by('rank').values('rank')[:1]))
+            ordering.append('tag_rank')
 
         if len(ordering):
-            users = users.order_by(*ordering, '-account__raised')
+            users = users.order_by(*ordering, '-account__raised', 'id')
 
         if kwargs.get('filter'):
             search = kwargs['filter']
@@ -331,10 +587,7 @@ class UserProfileQuerySet(models.QuerySet):
                 words = search.split(' ')
                 if len(words) == 1 and not words[0]:
                     return []
-                try:
-                    spelled = YandexSpeller().spelled(search)
-                except:
-                    spelled = search
+                spelled = kwargs.get('spelled') or self.spell(search)
                 options = [option for option in spelled.split(' ') if len(option) > 1]
                 digits = ''.join(re.findall('[0-9]', search))
                 phone_templates = [match.group(1) for match in re.finditer(r'(?=(\d{9}))', digits)] or ['-']
@@ -387,11 +640,42 @@ class UserProfileQuerySet(models.QuerySet):
 
                 users = name_exact | phone_endswith | name_words | name_contains | info_contains | phone_contains
 
+        availability = []
+
         if kwargs.get('days'):
-            dates = [datetime.strptime(day, '%Y-%m-%d') for day in kwargs.get('days')]
-            busy_users = users.filter(all_projects__days__date__in=dates, all_projects__is_wait=False).values('pk')
-            users = users.exclude(pk__in=busy_users)
-        return users.distinct()
+            dates = [datetime.strptime(day, '%Y-%m-%d').date() for day in kwargs.get('days')]
+            min_free = kwargs.get('min_free')
+            if isinstance(min_free, list):
+                min_free = min_free[0]
+            users = users.available(dates, int(min_free) if min_free else None)
+            if min_free:
+                availability.append('-free_days')
+
+        if kwargs.get('consecutive') and kwargs.get('start') and kwargs.get('end'):
+            length, start, end = [kwargs[key][0] if isinstance(kwargs[key], list) else kwargs[key]
+                                  for key in ['consecutive', 'start', 'end']]
+            start = datetime.strptime(start, '%Y-%m-%d').date()
+            end = datetime.strptime(end, '%Y-%m-%d').date()
+            users = users.available_in_row(int(length), start, end)
+            availability.append('-free_streak')
+
+        if availability:
+            users = users.order_by(*availability, *(users.query.order_by or ['-account__raised']))
+
+        return users
+
+    def tag_facets(self, **kwargs):
+        """
+        Number of profiles found by search(**kwargs) for each tag in one grouped query.
+        Selected tags are not applied, as tags are combined with OR. Returns [{id, title, count}]
+        """
+        kwargs = {key: value for key, value in kwargs.items() if key not in ['tags', 'asker']}
+        profiles = self.search(**kwargs)
+        if not isinstance(profiles, models.QuerySet):
+            return []
+        facets = ProfileTag.objects.filter(user__in=profiles.order_by().values('pk')).order_by() \
+            .values('tag_id', 'tag__title').annotate(count=Count('user', distinct=True)).order_by('-count', 'tag__title')
+        return [{'id': facet['tag_id'], 'title': facet['tag__title'], 'count': facet['count']} for facet in facets]
 
 
 class UserProfileManager(models.Manager):
@@ -401,7 +685,7 @@ class UserProfileManager(models.Manager):
         return UserProfileQuerySet(self.model, using=self._db)
 
 
-class UserProfile(models.Model):
+class UserProfile(TrackedFieldsMixin, models.Model):
     account = models.OneToOneField(Account, on_delete=models.SET_NULL, related_name='profile', null=True)
     first_name = models.CharField(max_length=64, **null)
     last_name = models.CharField(max_length=64, **null)
@@ -410,10 +694,17 @@ class UserProfile(models.Model):
     telegram = models.CharField(max_length=32, **null)
     avatar = models.ImageField(upload_to='avatars', **null)
     photo = models.ImageField(upload_to='photos', **null)
+    avatar_variants = models.JSONField(default=dict, blank=True)
+    photo_variants = models.JSONField(default=dict, blank=True)
     info = models.TextField(**null)
+    calendar_token = models.CharField(max_length=32, unique=True, **null)
+    calendar_updated = models.DateTimeField(default=timezone.now)
+    favorite_count = models.PositiveIntegerField(default=0)
 
     objects = UserProfileManager()
 
+    tracked_fields = ['avatar', 'photo', 'avatar_variants', 'photo_variants']
+
     @property
     def is_simulated(self):
         if self.account:
@@ -457,6 +748,57 @@ class UserProfile(models.Model):
     def days_off_project(self):
         return self.all_projects.get_or_create(creator__isnull=True)[0]
 
+    @staticmethod
+    def days_off_project_key(pk):
+        return f'days_off_project:{pk}'
+
+    @property
+    def days_off_project_id(self):
+        """Cached id of days_off_project, the key is deleted with the project and set only after commit"""
+        from django.db import transaction
+        key = self.days_off_project_key(self.id)
+        try:
+            pk = cache.get(key)
+        except Exception as e:
+            print(e)
+            return self.days_off_project.id
+        if not pk:
+            pk = self.days_off_project.id
+
+            def remember():
+                try:
+                    cache.set(key, pk, 24 * 60 * 60)
+                except Exception as e:
+                    print(e)
+            transaction.on_commit(remember)
+        return pk
+
+    def set_days_off(self, pick, dates=(), ranges=()):
+        """
+        Pick or unpick days off in one query.
+        ranges is a list of (start, end, weekdays) tuples, weekdays are ISO numbers (1 - monday) or None for every day
+        """
+        project_id = self.days_off_project_id
+        if pick:
+            dates = set(dates)
+            for start, end, weekdays in ranges:
+                dates.update(date for date in (start + timedelta(days=i) for i in range((end - start).days + 1))
+                             if not weekdays or date.isoweekday() in weekdays)
+            Day.objects.insert([Day(project_id=project_id, date=date) for date in dates])
+        else:
+            query = Q(date__in=dates)
+            for start, end, weekdays in ranges:
+                query |= Q(date__range=[start, end], **({'date__iso_week_day__in': weekdays} if weekdays else {}))
+            Day.objects.filter(query, project_id=project_id).delete()
+        UserProfile.objects.filter(pk=self.pk).touch_calendar()
+
+    def calendar_feed_token(self, new=False):
+        if not self.calendar_token or new:
+            import secrets
+            self.calendar_token = secrets.token_urlsafe(24)
+            UserProfile.objects.filter(pk=self.pk).update(calendar_token=self.calendar_token)
+        return self.calendar_token
+
     @classmethod
     def get(cls, username, alt=None):
         account = Account.get(username)
@@ -474,11 +816,24 @@ class UserProfile(models.Model):
     def get_actual_offers(self):
         return self.offers().actual().reverse()
 
-    def get_calendar(self, asker=None, start=None, end=None, project_id=0, offers=False):
-        if not start:
-            start = datetime.now().date()
-            start = start - timedelta(start.weekday() + 15 * 7)
-        from api.serializers import CalendarDaySerializer
+    def calendar_changed_dates(self, since, offers=False):
+        """Dates of the calendar with days or projects changed or deleted since the cursor"""
+        days = Day.objects.filter(project__creator=self) if offers else Day.objects.filter(project__user=self)
+        days = days.filter(Q(updated_at__gte=since) | Q(project__updated_at__gte=since) |
+                           Q(project__parent__updated_at__gte=since))
+        tombstones = Tombstone.objects.after(since).filter(model='day', **{'creator_id' if offers else 'user_id': self.id})
+        return set(days.order_by().values_list('date', flat=True).distinct()) | \
+            set(tombstones.order_by().values_list('date', flat=True).distinct())
+
+    def projects_changes(self, since):
+        """Ids of projects of the profile changed and deleted since the cursor"""
+        changed = Project.objects.filter(Q(user=self) | Q(creator=self) | Q(children__user=self)).filter(
+            Q(updated_at__gte=since) | Q(responses__user=self, responses__updated_at__gte=since))
+        deleted = Tombstone.objects.after(since).filter(Q(user_id=self.id) | Q(creator_id=self.id), model='project')
+        return set(changed.order_by().values_list('id', flat=True)), \
+            set(deleted.order_by().values_list('object_id', flat=True))
+
+    def calendar_days(self, start=None, end=None, project_id=0, offers=False, dates=None):
         if offers:
             all_days = Day.objects.filter(project__creator=self).exclude(project__user=self)
         else:
@@ -491,10 +846,29 @@ class UserProfile(models.Model):
             all_days = all_days.filter(date__gte=start)
         elif end:
             all_days = all_days.filter(date__lte=end)
+        if dates is not None:
+            all_days = all_days.filter(date__in=dates)
+        return all_days
+
+    def get_calendar(self, asker=None, start=None, end=None, project_id=0, offers=False, since=None):
+        """
+        Days of the calendar. With since only the changed dates are returned and listed in 'changed',
+        a client replaces these dates entirely
+        """
+        if not start:
+            start = datetime.now().date()
+            start = start - timedelta(start.weekday() + 15 * 7)
+        dates = None
+        if since:
+            dates = sorted(date for date in self.calendar_changed_dates(since, offers)
+                           if date >= start and (not end or date <= end))
+        all_days = self.calendar_days(start, end, project_id, offers, dates)
+        changed = {'changed': dates} if since else {}
 
         if offers:
             return {
-                'days': CalendarDaySerializer(all_days, many=True).dict()
+                'days': all_days.calendar(),
+                **changed
             }
 
         if not asker:
@@ -509,11 +883,12 @@ class UserProfile(models.Model):
                 days_off = all_days.exclude(project__creator=asker).exclude(project__is_wait=True)
                 days = all_days.filter(project__creator=asker).exclude(
                     project__canceled=asker)
-            days = CalendarDaySerializer(days, many=True).dict()
+            days = days.calendar()
 
         return {
             'days': days,
-            'daysOff': days_off.dates('date', 'day')
+            'daysOff': days_off.dates('date', 'day'),
+            **changed
         }
 
     def page(self, asker, start=None, end=None):
@@ -540,7 +915,9 @@ class UserProfile(models.Model):
             project = serializer.instance
             if not project.is_self:
                 from api.bot import BotNotification
+                from api.events import ProjectEvents
                 BotNotification.create_project(project)
+                ProjectEvents.create_project(project)
             return project
         print(serializer.errors)
         return {'error': 'Ошибка сохранения проекта'}
@@ -556,10 +933,13 @@ class UserProfile(models.Model):
             project = serializer.instance
             if not project.is_self:
                 from api.bot import BotNotification
+                from api.events import ProjectEvents
                 if project.creator == self:
                     BotNotification.update_project(project)
+                    ProjectEvents.update_project(project)
                 if project.user == self:
                     BotNotification.accept_project(project)
+                    ProjectEvents.accept_project(project)
             return serializer.instance
         print(serializer.errors)
         return {'error': 'Ошибка сохранения проекта'}
@@ -574,25 +954,58 @@ class UserProfile(models.Model):
             project.is_wait = True
             project.save()
             from api.bot import BotNotification
+            from api.events import ProjectEvents
             if project.creator == self:
                 BotNotification.cancel_project(project)
+                ProjectEvents.cancel_project(project)
             elif project.user == self:
                 BotNotification.decline_project(project)
+                ProjectEvents.decline_project(project)
         else:
             project.delete()
         return {}
 
     def update(self, **kwargs):
+        images = []
         for key, value in kwargs.items():
-            if key in ['avatar', 'photo'] and value:
-                if isinstance(value, list):
-                    value = value[0]
-                import uuid
-                ext = value.content_type.split('/')[-1]
-                filename = uuid.uuid4().hex
-                value.name = f'{filename}.{ext}'
+            if key in ['avatar', 'photo']:
+                setattr(self, f'{key}_variants', {})
+                if value:
+                    if isinstance(value, list):
+                        value = value[0]
+                    import uuid
+                    ext = value.content_type.split('/')[-1]
+                    filename = uuid.uuid4().hex
+                    value.name = f'{filename}.{ext}'
+                    images.append(key)
             setattr(self, key, value)
-        return self.test_save()
+        profile = self.test_save()
+        if images and isinstance(profile, UserProfile):
+            from django.db import transaction
+            from api.tasks import process_profile_images
+
+            def process():
+                try:
+                    process_profile_images.delay(self.id, images)
+                except Exception as e:
+                    print(e)
+            transaction.on_commit(process)
+        return profile
+
+    def process_images(self, fields):
+        """Make thumbnails of uploaded images, see api.images"""
+        from api.images import make_variants, variant_names
+        from api.media import queue_deletion
+        for field in fields:
+            field_file = getattr(self, field)
+            if not field_file:
+                continue
+            name = field_file.name
+            variants = make_variants(field_file)
+            updated = UserProfile.objects.filter(pk=self.pk, **{field: name}).update(
+                **{field: field_file.name, f'{field}_variants': variants})
+            if not updated:
+                queue_deletion([field_file.name, *variant_names(variants)])
 
     def test_save(self, last_key=None, last_value=None):
         try:
@@ -674,14 +1087,12 @@ class ProjectsQuerySet(models.QuerySet):
             options = [option for option in spelled.split(' ') if len(option) > 1]
             vector = SearchVector('title', 'client__name', 'client__company')
             projects = projects.filter(
-                Q(title__icontains=search) |
+                Q(display_title__icontains=search) |
                 Q(client__name__icontains=search) |
                 Q(client__company__icontains=search) |
-                Q(parent__title__icontains=search) |
-                Q(title__icontains=spelled) |
+                Q(display_title__icontains=spelled) |
                 Q(client__name__icontains=spelled) |
                 Q(client__company__icontains=spelled) |
-                Q(parent__title__icontains=spelled) |
                 Q(title__in=options) |
                 Q(client__name__in=options) |
                 Q(client__company__in=options) |
@@ -702,15 +1113,19 @@ class ProjectsManager(models.Manager):
         return ProjectsQuerySet(self.model, using=self._db)
 
 
-class Project(models.Model):
+class Project(TrackedFieldsMixin, models.Model):
     class Meta:
         ordering = ['-date_end', '-date_start']
+        indexes = [
+            models.Index(fields=['user'], condition=Q(is_wait=False), name='project_user_busy')
+        ]
 
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='all_projects', **null)
     creator = models.ForeignKey(UserProfile, on_delete=models.SET_NULL, related_name='created_projects', **null)
     date_start = models.DateField(**null)
     date_end = models.DateField(**null)
     title = models.CharField(max_length=64, **null)
+    display_title = models.CharField(max_length=160, default='', blank=True)
     client = models.ForeignKey(Client, on_delete=models.SET_NULL, **null, related_name='projects')
     money = models.IntegerField(**null)
     money_per_day = models.FloatField(**null)
@@ -725,15 +1140,38 @@ class Project(models.Model):
     parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='children', null=True, blank=True)
 
     is_series = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     objects = ProjectsManager()
 
+    tracked_fields = ['title', 'date_start', 'date_end', 'parent_id', 'creator_id']
+
+    def save(self, *args, **kwargs):
+        loaded_values = getattr(self, 'loaded_values', {})
+        if self._state.adding or any(field not in loaded_values or self.is_changed(field)
+                                     for field in self.tracked_fields):
+            self.display_title = self.build_title()
+        renamed = self.is_changed('title')
+        super().save(*args, **kwargs)
+        if renamed:
+            self.children_titles_set()
+
+    def children_titles_set(self):
+        """Update display titles of the series children after the series is renamed"""
+        children = list(self.children.all())
+        now = timezone.now()
+        for child in children:
+            child.display_title = self.make_title(child.title, child.date_start, child.date_end, self.title)
+            child.updated_at = now
+        Project.objects.bulk_update(children, ['display_title', 'updated_at'])
+
     def set_days(self, days):
-        self.days.set([Day.objects.get_or_create(project=self, **day)[0] for day in days])
-        Day.objects.filter(project__isnull=True).delete()
-        if self.days.count():
-            self.date_start = self.days.first().date
-            self.date_end = self.days.last().date
+        dates = [day['date'] for day in days]
+        self.days.exclude(date__in=dates).delete()
+        Day.objects.upsert([Day(project=self, **day) for day in days])
+        if dates:
+            self.date_start = min(dates)
+            self.date_end = max(dates)
         else:
             self.date_start = None
             self.date_end = None
@@ -747,7 +1185,8 @@ class Project(models.Model):
         return [i.date for i in self.days.all()]
 
     def child_delete(self, child):
-        self.children.remove(child)
+        child.parent = None
+        child.save()
         if self.children.count() == 0:
             self.delete()
         else:
@@ -781,18 +1220,25 @@ class Project(models.Model):
             self.save()
 
     def get_title(self):
-        if not self.creator:
-            return '*days_off*'
+        return self.display_title
 
-        title = self.title or ''
-        if not title:
-            start = self.date_start.strftime('%d.%m.%y')
-            end = self.date_end.strftime('%d.%m.%y')
+    def build_title(self):
+        if not self.creator_id:
+            return '*days_off*'
+        return self.make_title(self.title, self.date_start, self.date_end, self.parent.title if self.parent_id else None)
+
+    @staticmethod
+    def make_title(title, date_start, date_end, parent_title=None):
+        """Title or dates of the project, parent_title is the title of the series"""
+        title = title or ''
+        if not title and date_start and date_end:
+            start = date_start.strftime('%d.%m.%y')
+            end = date_end.strftime('%d.%m.%y')
             title = start
             if end != start:
                 title += ' - ' + end
-        if self.parent:
-            title = self.parent.title + ' / ' + title
+        if parent_title is not None:
+            title = parent_title + ' / ' + title
 
         return title
 
@@ -817,19 +1263,74 @@ class Project(models.Model):
             start = date_start - timedelta(days=date_start.weekday(), weeks=15)
             end = start + timedelta(weeks=68)
             result['calendar'].update(user.get_calendar(asker, start, end, project_id=self.id))
+        if asker and self.creator_id == asker.id and self.user_id != asker.id:
+            from api.analytics import project_statistics
+            result['statistics'] = project_statistics(self.id)
         return result
 
     def __str__(self):
         return self.get_title()
 
 
+class DaysQuerySet(models.QuerySet):
+    def calendar(self):
+        """
+        {date: [{'project': {'id', 'title', 'is_wait'}, 'info'}]} in one query,
+        the same as CalendarDaySerializer(days, many=True).dict()
+        """
+        days = {}
+        projects = {}
+        rows = self.values_list('date', 'info', 'project_id', 'project__display_title', 'project__is_wait')
+        for date, info, project_id, title, is_wait in rows:
+            project = projects.get(project_id)
+            if project is None:
+                project = projects[project_id] = {'id': project_id, 'title': title, 'is_wait': is_wait}
+            days.setdefault(date.isoformat(), []).append({'project': project, 'info': info})
+        return days
+
+    def delete(self):
+        Tombstone.objects.record_days(self)
+        return super().delete()
+
+
+class DaysManager(models.Manager):
+    use_for_related_fields = True
+
+    def get_queryset(self):
+        return DaysQuerySet(self.model, using=self._db)
+
+    def insert(self, days):
+        """Create days skipping those already existing for the same project and date"""
+        return self.bulk_create(days, ignore_conflicts=True)
+
+    def upsert(self, days):
+        """Create days or update info of existing ones for the same project and date in one query"""
+        days = list({(day.project_id, day.date): day for day in days}.values())
+        if not days:
+            return
+        now = timezone.now()
+        table = self.model._meta.db_table
+        values = ', '.join(['(%s, %s, %s, %s)'] * len(days))
+        sql = f'INSERT INTO {table} (project_id, date, info, updated_at) VALUES {values} ' \
+              f'ON CONFLICT (project_id, date) DO UPDATE SET info = EXCLUDED.info, updated_at = EXCLUDED.updated_at ' \
+              f'WHERE {table}.info IS DISTINCT FROM EXCLUDED.info'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for day in days for value in (day.project_id, day.date, day.info, now)])
+
+
 class Day(models.Model):
     class Meta:
-        ordering = ['date', 'project__date_start', 'project__date_end']
+        ordering = ['date', 'project__date_start', 'project__date_end', 'project_id']
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'date'], name='unique_day_project_date')
+        ]
 
     date = models.DateField()
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='days', null=True)
     info = models.TextField(**null)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = DaysManager()
 
     def __str__(self):
         return ' - '.join([str(self.project), str(self.date)])
@@ -844,12 +1345,147 @@ class FacebookAccount(models.Model):
         return f'{self.name} ({self.id})'
 
 
+class ProjectShowingManager(models.Manager):
+    buffer = 'showings:views'
+
+    # views without a response are deleted after this time, counters stay in ProjectStatistics
+    ttl = timedelta(days=90)
+
+    def view(self, project_id, user_id):
+        """Buffer the view in Redis, it is saved by flush_views. Saved at once without Redis"""
+        try:
+            from django_redis import get_redis_connection
+            from api.analytics import record_view
+            pipeline = get_redis_connection('default').pipeline(transaction=False)
+            pipeline.hsetnx(self.buffer, f'{project_id}:{user_id}', timezone.now().timestamp())
+            record_view(pipeline, project_id, user_id)
+            pipeline.execute()
+        except Exception as e:
+            print(e)
+            self.bulk_create([self.model(project_id=project_id, user_id=user_id)], ignore_conflicts=True)
+
+    def flush_views(self):
+        """Save buffered views in one query, existing showings are kept as they are"""
+        from django_redis import get_redis_connection
+        redis = get_redis_connection('default')
+        flushing = f'{self.buffer}:flush'
+        if not redis.exists(flushing):
+            try:
+                redis.rename(self.buffer, flushing)
+            except Exception:
+                # nothing buffered
+                return 0
+        views = {}
+        for key, timestamp in redis.hgetall(flushing).items():
+            project_id, user_id = map(int, key.decode().split(':'))
+            views[(project_id, user_id)] = datetime.fromtimestamp(float(timestamp), tz=timezone.utc)
+        projects = set(Project.objects.filter(id__in={key[0] for key in views}).values_list('id', flat=True))
+        users = set(UserProfile.objects.filter(id__in={key[1] for key in views}).values_list('id', flat=True))
+        showings = [
+            self.model(project_id=project_id, user_id=user_id, time=time)
+            for (project_id, user_id), time in views.items() if project_id in projects and user_id in users
+        ]
+        self.bulk_create(showings, ignore_conflicts=True)
+        redis.delete(flushing)
+        return len(showings)
+
+    def respond(self, project_id, user_id, **data):
+        """Create the response or mark the existing showing as responded in one query"""
+        now = timezone.now()
+        comment = ', comment = EXCLUDED.comment' if 'comment' in data else ''
+        sql = f'INSERT INTO {self.model._meta.db_table} (project_id, user_id, response, comment, time, updated_at) ' \
+              f'VALUES (%s, %s, true, %s, %s, %s) ' \
+              f'ON CONFLICT (project_id, user_id) DO UPDATE SET response = true, time = EXCLUDED.time, ' \
+              f'updated_at = EXCLUDED.updated_at{comment}'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [project_id, user_id, data.get('comment'), now, now])
+        from api.analytics import record_response
+        record_response(project_id)
+
+    def prune(self):
+        return self.filter(response=False, time__lt=timezone.now() - self.ttl).delete()
+
+
 class ProjectShowing(models.Model):
     class Meta:
         ordering = ['project', 'time']
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'user'], name='unique_showing_project_user')
+        ]
 
     project = models.ForeignKey('Project', related_name='responses', on_delete=models.CASCADE)
     user = models.ForeignKey('UserProfile', related_name='responses', on_delete=models.CASCADE, **null)
     response = models.BooleanField(default=False)
     comment = models.TextField(**null)
-    time = models.DateTimeField(auto_now_add=True)
+    time = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ProjectShowingManager()
+
+
+class ProjectStatistics(models.Model):
+    """Offer views and responses, persisted from Redis counters by api.analytics.persist"""
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, primary_key=True, related_name='statistics')
+    views = models.IntegerField(default=0)
+    responses = models.IntegerField(default=0)
+    viewers = models.IntegerField(default=0)
+    viewers_hll = models.BinaryField(**null)
+
+
+class TombstonesManager(models.Manager):
+    def after(self, since):
+        return self.filter(deleted__gte=since)
+
+    def record_days(self, days):
+        """Save tombstones of days before deleting them, one INSERT ... SELECT query"""
+        ids, params = days.order_by().values('id').query.sql_with_params()
+        day, project = Day._meta.db_table, Project._meta.db_table
+        sql = f"INSERT INTO {self.model._meta.db_table} (model, object_id, user_id, creator_id, date, deleted) " \
+              f"SELECT 'day', d.id, p.user_id, p.creator_id, d.date, %s FROM {day} d " \
+              f"JOIN {project} p ON p.id = d.project_id WHERE d.id IN ({ids})"
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [timezone.now(), *params])
+
+    def prune(self):
+        return self.filter(deleted__lt=timezone.now() - self.model.ttl).delete()
+
+
+class Tombstone(models.Model):
+    """
+    Deleted projects and days for delta sync (?since=<cursor>).
+    Profiles are stored as plain ids, the tombstone outlives the project and may outlive the profile
+    """
+    class Meta:
+        ordering = ['deleted']
+
+    model = models.CharField(max_length=16)
+    object_id = models.IntegerField()
+    user_id = models.IntegerField(**null)
+    creator_id = models.IntegerField(**null)
+    date = models.DateField(**null)
+    deleted = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = TombstonesManager()
+
+    # older cursors get the full response
+    ttl = timedelta(days=30)
+    # changes committed by concurrent transactions right before the cursor are sent once more
+    overlap = timedelta(seconds=10)
+
+    @classmethod
+    def cursor(cls):
+        return f'{(timezone.now() - cls.overlap).timestamp():.6f}'
+
+    @classmethod
+    def parse_cursor(cls, cursor):
+        """Datetime of the cursor, None for an empty, invalid or expired one"""
+        try:
+            since = datetime.fromtimestamp(float(cursor), tz=timezone.utc)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        if since < timezone.now() - cls.ttl:
+            return None
+        return since
+
+    def __str__(self):
+        return f'{self.model} {self.object_id}'
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from api.consumers import EventsConsumer
+
+websocket_urlpatterns = [
+    path('ws/', EventsConsumer.as_asgi()),
+]
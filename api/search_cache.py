@@ -0,0 +1,154 @@
+"""
+Cache of profile search results. The first SEARCH_CACHE_PAGES pages of ids found for a normalized query,
+the total count, the spelled filter and, once asked, tag facets are kept for SEARCH_CACHE_TTL seconds
+under a version key. The version is bumped when profiles become public or hidden, are raised or change tags.
+Other changes, including calendars for queries with dates, show up when the entry expires.
+Favorites of the asker are merged into cached ids, so one entry serves everybody.
+Deeper pages are left to the database
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION = 'search:version'
+SINGLE = ['filter', 'min_free', 'consecutive', 'start', 'end', 'exclude', 'order']
+MULTIPLE = ['tags', 'days']
+AVAILABILITY = ['free_days', 'free_streak']
+
+
+def normalize(data):
+    """Search arguments from request data: lists for tags and days, sorted and unique, strings for the rest"""
+    def values(key):
+        if hasattr(data, 'getlist'):
+            return data.getlist(key)
+        value = data.get(key)
+        if value is None:
+            return []
+        return [str(item) for item in value] if isinstance(value, (list, tuple)) else [str(value)]
+
+    query = {}
+    for key in SINGLE:
+        value = values(key)
+        if value and value[0] != '':
+            query[key] = value[0]
+    for key in MULTIPLE:
+        value = sorted(set(values(key)) - {''})
+        if value:
+            query[key] = value
+    return query
+
+
+def bump():
+    """Invalidate cached results"""
+    try:
+        cache.incr(VERSION)
+    except ValueError:
+        cache.set(VERSION, 1, None)
+    except Exception as e:
+        print(e)
+
+
+def key(query):
+    digest = hashlib.sha1(json.dumps(query, sort_keys=True).encode()).hexdigest()
+    return f'search:{cache.get(VERSION, 0)}:{digest}'
+
+
+def rows(profiles, limit=None):
+    """[[id, *availability]] in search order, availability values are kept for merging favorites"""
+    fields = [field.lstrip('-') for field in profiles.query.order_by if field.lstrip('-') in AVAILABILITY]
+    profiles = profiles.values_list('pk', *fields)
+    return [list(row) for row in (profiles[:limit] if limit else profiles)]
+
+
+def search_kwargs(query, result):
+    return dict(query, spelled=result['spelled']) if result.get('spelled') else query
+
+
+def entry(queryset, query):
+    """{'count': total, 'rows': first pages of rows, 'spelled': filter after the speller}"""
+    result = {'count': 0, 'rows': [], 'created': time.time()}
+    if query.get('filter') and query['filter'] != '***':
+        result['spelled'] = queryset.spell(query['filter'])
+    profiles = queryset.search(**search_kwargs(query, result))
+    if isinstance(profiles, list):
+        return result
+    limit = settings.SEARCH_CACHE_PAGES * settings.SEARCH_CACHE_PAGE_SIZE
+    result['rows'] = rows(profiles, limit)
+    result['count'] = len(result['rows']) if len(result['rows']) < limit else profiles.count()
+    return result
+
+
+def add_facets(queryset, query, result):
+    result['facets'] = queryset.tag_facets(**search_kwargs(query, result))
+
+
+def cached_entry(queryset, query, facets=False):
+    """Entry from the cache, facets are added to it on the first request for them"""
+    try:
+        cache_key = key(query)
+        result = cache.get(cache_key)
+        if result is None or facets and 'facets' not in result:
+            result = result or entry(queryset, query)
+            if facets:
+                add_facets(queryset, query, result)
+            timeout = settings.SEARCH_CACHE_TTL - (time.time() - result['created'])
+            if timeout > 0:
+                cache.set(cache_key, result, timeout)
+        return result
+    except Exception as e:
+        print(e)
+        result = entry(queryset, query)
+        if facets:
+            add_facets(queryset, query, result)
+        return result
+
+
+def merge(favorites, head, complete):
+    """
+    Ids ordered as search orders them for the asker: by availability, then favorites first.
+    Without the complete list only the part up to the last cached non favorite is known
+    """
+    favorite_ids = {row[0] for row in favorites}
+    items = [([-value for value in row[1:]], False, i, row[0]) for i, row in enumerate(favorites)]
+    items += [([-value for value in row[1:]], True, i, row[0]) for i, row in enumerate(head)
+              if row[0] not in favorite_ids]
+    items.sort()
+    ids = [item[3] for item in items]
+    if complete:
+        return ids
+    known = [i for i, item in enumerate(items) if item[1]]
+    return ids[:known[-1] + 1] if known else []
+
+
+def favorite_rows(queryset, query, result, favorite_of):
+    """
+    Rows of found favorites in search order. Favorites among cached rows are taken from them,
+    only the rest of an incomplete result are searched in the database
+    """
+    favorite_ids = set(favorite_of.favorites.values_list('id', flat=True))
+    if not favorite_ids or not result['count']:
+        return []
+    favorites = [row for row in result['rows'] if row[0] in favorite_ids]
+    missing = favorite_ids - {row[0] for row in favorites}
+    if missing and len(result['rows']) < result['count']:
+        profiles = queryset.filter(pk__in=missing).search(**search_kwargs(query, result))
+        favorites += rows(profiles) if not isinstance(profiles, list) else []
+    return favorites
+
+
+def page(queryset, query, result, number, favorite_of=None):
+    """
+    Ids of the page (counted from 0) of the cached_entry result, favorite_of is the account of the asker.
+    None when the page is not covered by the cache
+    """
+    per_page = settings.SEARCH_CACHE_PAGE_SIZE
+    complete = len(result['rows']) == result['count']
+    favorites = favorite_rows(queryset, query, result, favorite_of) if favorite_of else []
+    ids = merge(favorites, result['rows'], complete)
+    start = number * per_page
+    if not complete and start + per_page > len(ids):
+        return None
+    return ids[start:start + per_page]
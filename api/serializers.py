@@ -1,4 +1,7 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
+
+from api.images import variant_url
 from api.models import Project, Day, Client, UserProfile, Tag, FacebookAccount, Account
 
 
@@ -59,10 +62,26 @@ class ClientItemSerializer(ItemSerializer):
         read_only_fields = ['full_name']
 
 
-class ProfileItemSerializer(ItemSerializer):
+class ProfileAvatarSerializer(ItemSerializer):
+    """Returns avatar thumbnail of avatar_size instead of the original"""
     class Meta:
         model = UserProfile
-        fields = ['id', 'username', 'full_name', 'avatar', 'is_simulated']
+
+    avatar_size = 256
+    avatar = serializers.SerializerMethodField('get_avatar')
+    avatar_webp = serializers.SerializerMethodField('get_avatar_webp')
+
+    def get_avatar(self, instance):
+        return variant_url(instance.avatar, instance.avatar_variants, self.avatar_size)
+
+    def get_avatar_webp(self, instance):
+        return variant_url(instance.avatar, instance.avatar_variants, self.avatar_size, 'webp')
+
+
+class ProfileItemSerializer(ProfileAvatarSerializer):
+    class Meta:
+        model = UserProfile
+        fields = ['id', 'username', 'full_name', 'avatar', 'avatar_webp', 'is_simulated']
 
     def to_representation(self, obj):
         ret = super().to_representation(obj)
@@ -74,10 +93,12 @@ class ProfileItemSerializer(ItemSerializer):
         return ret
 
 
-class ProfileItemShortSerializer(ItemSerializer):
+class ProfileItemShortSerializer(ProfileAvatarSerializer):
     class Meta:
         model = UserProfile
-        fields = ['id', 'full_name', 'avatar']
+        fields = ['id', 'full_name', 'avatar', 'avatar_webp']
+
+    avatar_size = 64
 
 
 class ProjectShortSerializer(ItemSerializer):
@@ -111,13 +132,23 @@ class ClientShortSerializer(ItemSerializer):
 class ProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
-        exclude = ['id', 'account']
+        exclude = ['id', 'account', 'avatar_variants', 'photo_variants', 'calendar_token', 'calendar_updated',
+                   'favorite_count']
 
     username = serializers.CharField(read_only=True)
     full_name = serializers.CharField(read_only=True)
     is_public = serializers.SerializerMethodField('get_is_public', read_only=True)
     tags = serializers.SerializerMethodField('get_tags')
     is_simulated = serializers.BooleanField(read_only=True)
+    variants = serializers.SerializerMethodField('get_variants')
+
+    @staticmethod
+    def get_variants(instance):
+        return {
+            field: {size: {extension: default_storage.url(name) for extension, name in formats.items()}
+                    for size, formats in getattr(instance, f'{field}_variants').items()}
+            for field in ['avatar', 'photo']
+        }
 
     @staticmethod
     def get_tags(instance):
@@ -194,7 +225,7 @@ class ListProjectDaySerializer(serializers.ListSerializer):
 class ProjectDaySerializer(serializers.ModelSerializer):
     class Meta:
         model = Day
-        exclude = ['id', 'project']
+        exclude = ['id', 'project', 'updated_at']
         list_serializer_class = ListProjectDaySerializer
 
 
@@ -226,7 +257,7 @@ class CalendarDayProjectSerializer(serializers.ModelSerializer):
 class CalendarDaySerializer(serializers.ModelSerializer):
     class Meta:
         model = Day
-        exclude = ['id']
+        exclude = ['id', 'updated_at']
         list_serializer_class = ListCalendarDaySerializer
 
     project = CalendarDayProjectSerializer()
@@ -240,7 +271,7 @@ class ProjectSerializerBase(serializers.ModelSerializer):
     class Meta:
         model = Project
         fields = '__all__'
-        read_only_fields = ['id', 'date_start', 'date_end', 'children', 'response']
+        read_only_fields = ['id', 'date_start', 'date_end', 'children', 'response', 'display_title']
 
     def __init__(self, *args, asker=None, **kwargs):
         self.asker = asker
@@ -1,40 +1,35 @@
-import os
-
-from django.db import models
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import models, transaction
 from django.dispatch import receiver
 
-from .models import UserProfile, Account
+from .images import variant_names
+from .media import queue_deletion
+from . import signup, search_cache
+from .models import UserProfile, Account, Project, Tombstone
 
 
 @receiver(models.signals.pre_save, sender=UserProfile)
 def auto_delete_file_on_change(sender, instance, **kwargs):
-
-    def deleting(old_file, new_file):
-        if old_file and old_file != new_file:
-            if os.path.isfile(old_file.path):
-                os.remove(old_file.path)
-
-    if not instance.pk:
+    if instance._state.adding:
         return False
 
-    try:
-        profile = UserProfile.objects.get(pk=instance.pk)
-    except UserProfile.DoesNotExist:
-        return False
-
-    deleting(profile.avatar or None, instance.avatar)
-    deleting(profile.photo or None, instance.photo)
+    names = []
+    for field in ['avatar', 'photo']:
+        if instance.is_changed(field):
+            names.append(instance.loaded(field))
+            names += variant_names(instance.loaded(f'{field}_variants'))
+    if names:
+        transaction.on_commit(lambda: queue_deletion(names))
 
 
 @receiver(models.signals.post_delete, sender=UserProfile)
 def auto_delete_file_on_delete(sender, instance, **kwargs):
-
-    def deleting(obj):
-        if obj and os.path.isfile(obj.path):
-            os.remove(instance.avatar.path)
-
-    deleting(instance.avatar)
-    deleting(instance.photo)
+    names = []
+    for field in ['avatar', 'photo']:
+        names.append(instance.tracked_value(field))
+        names += variant_names(getattr(instance, f'{field}_variants'))
+    transaction.on_commit(lambda: queue_deletion(names))
 
 
 @receiver(models.signals.pre_delete, sender=UserProfile)
@@ -43,32 +38,43 @@ def delete_account_and_user(sender, instance, **kwargs):
         instance.account.delete()
 
 
+@receiver(models.signals.post_save, sender=User)
+def user_signup_index(sender, instance, **kwargs):
+    transaction.on_commit(lambda: signup.add('username', instance.username))
+
+
 @receiver(models.signals.post_save, sender=Account)
-def account_post_save(sender, instance, created, **kwargs):
-    if not instance.is_confirmed:
-        from .tasks import check_user_confirmation
-        try:
-            check_user_confirmation.apply_async((instance.username, ), countdown=30 * 60)
-        except Exception as e:
-            print(e)
+def search_cache_bump(sender, instance, **kwargs):
+    if instance.is_changed('is_public') or instance.is_changed('raised'):
+        transaction.on_commit(search_cache.bump)
+
+
+@receiver(models.signals.post_delete, sender=Account)
+def search_cache_bump_on_delete(sender, instance, **kwargs):
+    if instance.is_public:
+        transaction.on_commit(search_cache.bump)
+
+
+@receiver(models.signals.post_save, sender=Account)
+def account_signup_index(sender, instance, **kwargs):
+    if instance.email_confirm or instance.phone_confirm:
+        def add():
+            signup.add('email', instance.email_confirm)
+            signup.add('phone', instance.phone_confirm)
+        transaction.on_commit(add)
 
 
 @receiver(models.signals.pre_save, sender=Account)
 def account_pre_save(sender, instance, **kwargs):
     if not instance.is_confirmed:
         instance.is_public = False
-    else:
-        if instance.pk:
-            pre_account = Account.objects.get(pk=instance.pk)
-            if not pre_account.is_confirmed:
-                instance.is_public = True
-        else:
-            if instance.is_confirmed:
-                instance.is_public = True
+    elif not (instance.loaded('email_confirm') or instance.loaded('phone_confirm')):
+        instance.is_public = True
 
 
 @receiver(models.signals.pre_delete, sender=Account)
 def account_pre_delete(sender, instance, **kwargs):
+    instance.favorite_ids = list(instance.favorites.values_list('id', flat=True))
     try:
         instance.profile.update(photo=None, avatar=None)
     except:
@@ -77,7 +83,49 @@ def account_pre_delete(sender, instance, **kwargs):
 
 @receiver(models.signals.post_delete, sender=Account)
 def account_post_delete(sender, instance, **kwargs):
+    if getattr(instance, 'favorite_ids', None):
+        UserProfile.objects.filter(pk__in=instance.favorite_ids).count_favorites()
     from api.bot import BotNotification
     BotNotification.send_to_admins(f'Аккаунт удален.\nusername: {instance.username}')
     if instance.user:
         instance.user.delete()
+
+
+@receiver(models.signals.m2m_changed, sender=Account.favorites.through)
+def favorites_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance.cleared_favorites = list(instance.favorites.values_list('id', flat=True)) if not reverse else []
+    if action not in ['post_add', 'post_remove', 'post_clear']:
+        return
+    if reverse:
+        ids = [instance.pk]
+    elif action == 'post_clear':
+        ids = getattr(instance, 'cleared_favorites', [])
+    else:
+        ids = pk_set
+    if ids:
+        UserProfile.objects.filter(pk__in=ids).count_favorites()
+
+
+@receiver(models.signals.post_save, sender=Project)
+@receiver(models.signals.post_delete, sender=Project)
+def project_touch_calendar(sender, instance, **kwargs):
+    ids = {instance.user_id, instance.creator_id} - {None}
+    if ids:
+        UserProfile.objects.filter(pk__in=ids).touch_calendar()
+
+
+@receiver(models.signals.post_delete, sender=Project)
+def days_off_project_delete(sender, instance, **kwargs):
+    if not instance.creator_id and instance.user_id:
+        try:
+            cache.delete(UserProfile.days_off_project_key(instance.user_id))
+        except Exception as e:
+            print(e)
+
+
+@receiver(models.signals.pre_delete, sender=Project)
+def project_tombstones(sender, instance, **kwargs):
+    Tombstone.objects.record_days(instance.days.all())
+    Tombstone.objects.create(model='project', object_id=instance.id, user_id=instance.user_id,
+                             creator_id=instance.creator_id)
@@ -0,0 +1,80 @@
+"""
+Redis sets of taken usernames, emails and phones for live signup validation.
+A value missing in a set is free, a found one is confirmed in the database, so values left after
+a delete or rename only cost a query. Until rebuild_signup_index fills the sets every check goes to the database
+"""
+READY = 'signup:ready'
+FIELDS = {
+    'username': 'username',
+    'email': 'email_confirm',
+    'phone': 'phone_confirm',
+}
+
+
+def key(kind):
+    return f'signup:{kind}'
+
+
+def redis():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def queryset(kind):
+    from django.contrib.auth.models import User
+    from api.models import Account
+    return User.objects if kind == 'username' else Account.objects
+
+
+def add(kind, *values):
+    values = [value for value in values if value]
+    if not values:
+        return
+    try:
+        redis().sadd(key(kind), *values)
+    except Exception as e:
+        print(e)
+        # the sets miss these values now, checks go to the database until the next rebuild
+        try:
+            redis().delete(READY)
+        except Exception as e:
+            print(e)
+
+
+def in_database(kind, value):
+    return queryset(kind).filter(**{FIELDS[kind]: value}).exists()
+
+
+def is_taken(kind, value):
+    try:
+        pipeline = redis().pipeline(transaction=False)
+        pipeline.exists(READY)
+        pipeline.sismember(key(kind), value)
+        ready, member = pipeline.execute()
+    except Exception as e:
+        print(e)
+        return in_database(kind, value)
+    if ready and not member:
+        return False
+    return in_database(kind, value)
+
+
+def rebuild(chunk_size=5000):
+    """Add all taken values to the sets, values saved meanwhile are added by signals. False when Redis fails"""
+    try:
+        connection = redis()
+        for kind, field in FIELDS.items():
+            values = queryset(kind).exclude(**{f'{field}__isnull': True}).values_list(field, flat=True)
+            chunk = []
+            for value in values.iterator(chunk_size=chunk_size):
+                chunk.append(value)
+                if len(chunk) == chunk_size:
+                    connection.sadd(key(kind), *chunk)
+                    chunk = []
+            if chunk:
+                connection.sadd(key(kind), *chunk)
+        connection.set(READY, 1)
+    except Exception as e:
+        print(e)
+        return False
+    return True
@@ -0,0 +1,177 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Account, UserProfile, Tag, ProfileTag, Client, Project, Day
+
+FIRST_NAMES = [
+    'Александр', 'Алексей', 'Анна', 'Анастасия', 'Андрей', 'Антон', 'Артём', 'Борис', 'Валерия', 'Василий',
+    'Вера', 'Виктор', 'Виктория', 'Владимир', 'Дарья', 'Денис', 'Дмитрий', 'Евгений', 'Екатерина', 'Елена',
+    'Иван', 'Игорь', 'Илья', 'Ирина', 'Кирилл', 'Ксения', 'Леонид', 'Мария', 'Максим', 'Михаил',
+    'Наталья', 'Никита', 'Николай', 'Олег', 'Ольга', 'Павел', 'Полина', 'Роман', 'Светлана', 'Сергей',
+    'София', 'Станислав', 'Татьяна', 'Тимур', 'Фёдор', 'Юлия', 'Юрий', 'Ярослав'
+]
+
+LAST_NAMES = [
+    'Абрамов', 'Белов', 'Васильев', 'Волков', 'Воробьёв', 'Гаврилов', 'Голубев', 'Григорьев', 'Давыдов', 'Егоров',
+    'Жуков', 'Зайцев', 'Захаров', 'Иванов', 'Ильин', 'Казаков', 'Киселёв', 'Козлов', 'Комаров', 'Крылов',
+    'Кузнецов', 'Лебедев', 'Макаров', 'Медведев', 'Морозов', 'Никитин', 'Новиков', 'Орлов', 'Павлов', 'Попов',
+    'Романов', 'Семёнов', 'Смирнов', 'Соколов', 'Соловьёв', 'Степанов', 'Тарасов', 'Титов', 'Фёдоров', 'Фролов'
+]
+
+TAGS = [
+    'Режиссёр', 'Оператор', 'Продюсер', 'Гаффер', 'Осветитель', 'Звукорежиссёр', 'Монтажёр', 'Фотограф',
+    'Гримёр', 'Художник по костюмам', 'Художник-постановщик', 'Фокус-пуллер', 'Ассистент режиссёра',
+    'Кастинг-директор', 'Колорист', 'Стедикамщик', 'Механик камеры', 'Локейшн-менеджер'
+]
+
+COMPANIES = ['', '', 'Мосфильм', 'Red Pepper', 'Star Media', 'Среда', 'Yellow Black and White', 'Амедиа', 'Тайм']
+
+PROJECT_TITLES = [
+    None, None, None, 'Реклама', 'Клип', 'Сериал', 'Полный метр', 'Короткий метр', 'Фотосессия', 'Промо',
+    'Документальный фильм', 'Шоу', 'Корпоратив', 'Презентация'
+]
+
+
+class Simulator:
+    """
+    Offline, deterministic generator of simulated accounts with their tags, clients, projects, series and days.
+    Everything is written with bulk_create, so signals and notifications are not triggered.
+    """
+
+    def __init__(self, seed=0, password='qwerty', prefix=None, period=(-60, 120)):
+        self.random = random.Random(seed)
+        self.password = make_password(password)
+        self.prefix = prefix or f's{seed}u'
+        self.period = period
+        self.today = timezone.now().date()
+
+    def name(self):
+        first_name = self.random.choice(FIRST_NAMES)
+        last_name = self.random.choice(LAST_NAMES)
+        if first_name[-1] in 'ая' and last_name[-1] in 'вн':
+            last_name += 'а'
+        return first_name, last_name
+
+    def dates(self, min_days=1, max_days=8):
+        start = self.today + timedelta(days=self.random.randint(*self.period))
+        return [start + timedelta(days=i) for i in range(self.random.randint(min_days, max_days))]
+
+    def tags(self):
+        existing = dict(Tag.objects.filter(title__in=TAGS).values_list('title', 'id'))
+        missing = [Tag(title=title, default=True) for title in TAGS if title not in existing]
+        Tag.objects.bulk_create(missing)
+        existing.update((tag.title, tag.id) for tag in missing)
+        return [existing[title] for title in TAGS]
+
+    @transaction.atomic
+    def create(self, number=1, projects=(1, 10), days_off=(0, 10), clients=(0, 5), offers=0.3, series=0.1):
+        """
+        Create `number` simulated profiles. `projects`, `days_off` and `clients` are (min, max) ranges per profile,
+        `offers` is the share of projects created by another profile and `series` is the share of series.
+        Returns the list of created profiles.
+        """
+        usernames = User.objects.filter(username__regex=rf'^{self.prefix}[0-9]+$').values_list('username', flat=True)
+        offset = max((int(username[len(self.prefix):]) for username in usernames), default=-1) + 1
+        users = []
+        names = []
+        for i in range(offset, offset + number):
+            users.append(User(username=f'{self.prefix}{i}', password=self.password, is_staff=True))
+            names.append(self.name())
+        users = User.objects.bulk_create(users)
+
+        now = timezone.now()
+        accounts = Account.objects.bulk_create([Account(
+            user=user,
+            email_confirm=f'{user.username}@dayspick.ru',
+            is_public=True,
+            raised=now - timedelta(minutes=self.random.randint(0, 60 * 24 * 30))
+        ) for user in users])
+
+        from api import signup, search_cache
+        usernames, emails = [user.username for user in users], [account.email_confirm for account in accounts]
+        transaction.on_commit(lambda: (signup.add('username', *usernames), signup.add('email', *emails)))
+        transaction.on_commit(search_cache.bump)
+
+        profiles = UserProfile.objects.bulk_create([UserProfile(
+            account=account,
+            first_name=first_name,
+            last_name=last_name,
+            info=self.random.choice([None, 'Опыт работы более 5 лет', 'Работаю с собственной техникой'])
+        ) for account, (first_name, last_name) in zip(accounts, names)])
+        for account, profile in zip(accounts, profiles):
+            account.profile = profile
+
+        tag_ids = self.tags()
+        ProfileTag.objects.bulk_create([
+            ProfileTag(tag_id=tag_id, user=profile, rank=rank)
+            for profile in profiles
+            for rank, tag_id in enumerate(self.random.sample(tag_ids, self.random.randint(0, 3)))
+        ])
+
+        all_clients = Client.objects.bulk_create([
+            Client(user=profile, name=self.random.choice(FIRST_NAMES), company=self.random.choice(COMPANIES))
+            for profile in profiles
+            for _ in range(self.random.randint(*clients))
+        ])
+        profile_clients = {}
+        for client in all_clients:
+            profile_clients.setdefault(client.user_id, []).append(client)
+
+        parents, children, others = [], [], []
+        for profile in profiles:
+            parents.append((Project(user=profile, creator=None), self.dates(*days_off)))
+            for _ in range(self.random.randint(*projects)):
+                creator = profile
+                if len(profiles) > 1 and self.random.random() < offers:
+                    creator = self.random.choice(profiles)
+                is_self = creator == profile
+                client = None
+                if profile_clients.get(creator.id) and self.random.random() < 0.7:
+                    client = self.random.choice(profile_clients[creator.id])
+                fields = {
+                    'user': profile,
+                    'creator': creator,
+                    'client': client,
+                    'money_per_day': self.random.choice([None, 5000, 10000, 15000, 25000]),
+                    'is_paid': self.random.random() < 0.3,
+                    'is_wait': not is_self and self.random.random() < 0.5,
+                    'confirmed': is_self or self.random.random() < 0.7,
+                }
+                if self.random.random() < series:
+                    parent = Project(title=self.random.choice(PROJECT_TITLES[3:]), is_series=True, **fields)
+                    parents.append((parent, []))
+                    for _ in range(self.random.randint(1, 4)):
+                        children.append((parent, Project(title=self.random.choice(PROJECT_TITLES), **fields),
+                                         self.dates()))
+                else:
+                    others.append((Project(title=self.random.choice(PROJECT_TITLES), **fields), self.dates()))
+
+        for parent, child, dates in children:
+            parent.date_start = min(filter(None, [parent.date_start, dates[0]]))
+            parent.date_end = max(filter(None, [parent.date_end, dates[-1]]))
+        for project, dates in parents + others:
+            if dates:
+                project.date_start, project.date_end = dates[0], dates[-1]
+        for parent, child, dates in children:
+            child.date_start, child.date_end = dates[0], dates[-1]
+
+        for project, dates in parents + others:
+            project.display_title = project.build_title()
+        Project.objects.bulk_create([project for project, dates in parents])
+        for parent, child, dates in children:
+            child.parent = parent
+            child.display_title = child.build_title()
+        Project.objects.bulk_create([child for parent, child, dates in children] + [p for p, dates in others])
+
+        Day.objects.bulk_create([
+            Day(project=project, date=date)
+            for project, dates in parents + others + [(child, dates) for parent, child, dates in children]
+            for date in dates
+        ])
+
+        return profiles
@@ -2,13 +2,17 @@ from timespick.celery import app
 
 
 @app.task(name='Удаление неподтвержденных пользователей')
-def check_user_confirmation(username):
+def delete_unconfirmed_accounts(username=None):
+    """username is accepted for delayed tasks queued per account before the sweep"""
     from api.models import Account
-    account = Account.get(username)
-    if account:
-        if not account.telegram_chat_id and not account.is_confirmed:
-            account.delete()
-            print(f'Account {username} was deleted because it was not confirmed')
+    usernames = ', '.join(Account.objects.delete_unconfirmed())
+    if usernames:
+        print(f'Accounts {usernames} were deleted because they were not confirmed')
+        try:
+            from api.bot import BotNotification
+            BotNotification.send_to_admins(f'Аккаунт удален.\nusername: {usernames}')
+        except Exception as e:
+            print(e)
 
 
 @app.task(name='Уведомления администраторам')
@@ -21,3 +25,51 @@ def bot_admin_notification(message):
 def bot_send_message(*args, **kwargs):
     from api.bot import bot
     bot.send_message(*args, **kwargs)
+
+
+@app.task(name='Обработка изображений профиля')
+def process_profile_images(profile_id, fields):
+    from api.models import UserProfile
+    profile = UserProfile.objects.filter(pk=profile_id).first()
+    if profile:
+        profile.process_images(fields)
+
+
+@app.task(name='Удаление медиафайлов')
+def delete_queued_media():
+    from api.media import delete_queued
+    deleted = delete_queued()
+    if deleted:
+        print(f'{deleted} media files were deleted')
+
+
+@app.task(name='Удаление устаревших tombstone')
+def prune_tombstones():
+    from api.models import Tombstone
+    deleted, _ = Tombstone.objects.prune()
+    if deleted:
+        print(f'{deleted} tombstones were deleted')
+
+
+@app.task(name='Сохранение просмотров проектов')
+def flush_project_views():
+    from api.models import ProjectShowing
+    saved = ProjectShowing.objects.flush_views()
+    if saved:
+        print(f'{saved} project views were saved')
+
+
+@app.task(name='Сохранение статистики проектов')
+def persist_project_statistics():
+    from api.analytics import persist
+    persisted = persist()
+    if persisted:
+        print(f'Statistics of {persisted} projects were saved')
+
+
+@app.task(name='Удаление старых просмотров проектов')
+def prune_project_showings():
+    from api.models import ProjectShowing
+    deleted, _ = ProjectShowing.objects.prune()
+    if deleted:
+        print(f'{deleted} project showings were deleted')
@@ -1,3 +1,153 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User, update_last_login
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api import search_cache
+from api.models import Account, UserProfile, UserProfileQuerySet
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_accounts(*usernames, confirmed=True):
+    return Account.objects.create_accounts([
+        dict(username=username, **({'email_confirm': f'{username}@example.com'} if confirmed else {}))
+        for username in usernames
+    ], notify=False)
+
+
+class NormalizeTest(TestCase):
+    def test_query_dict(self):
+        data = QueryDict('tags=3&tags=1&tags=3&days=&filter=&order=popular&page=2')
+        self.assertEqual(search_cache.normalize(data), {'order': 'popular', 'tags': ['1', '3']})
+
+    def test_dict(self):
+        data = {'tags': [2, 1], 'days': '2021-01-01', 'min_free': 1, 'exclude': None}
+        self.assertEqual(search_cache.normalize(data), {'min_free': '1', 'tags': ['1', '2'], 'days': ['2021-01-01']})
+
+    def test_same_key(self):
+        first = search_cache.normalize(QueryDict('tags=1&tags=2'))
+        second = search_cache.normalize({'tags': ['2', '1', '2']})
+        self.assertEqual(search_cache.key(first), search_cache.key(second))
+
+
+class MergeTest(TestCase):
+    def test_favorites_first(self):
+        self.assertEqual(search_cache.merge([[3]], [[1], [2], [3], [4]], True), [3, 1, 2, 4])
+
+    def test_availability_before_favorites(self):
+        head = [[1, 5], [2, 4], [3, 2]]
+        self.assertEqual(search_cache.merge([[3, 2], [4, 4]], head, True), [1, 4, 2, 3])
+
+    def test_incomplete_stops_at_last_cached(self):
+        self.assertEqual(search_cache.merge([[9, 1]], [[1, 5], [2, 3]], False), [1, 2])
+        self.assertEqual(search_cache.merge([[9, 4]], [[1, 5], [2, 3]], False), [1, 9, 2])
+
+
+@override_settings(CACHES=LOCMEM, SEARCH_CACHE_PAGES=2, SEARCH_CACHE_PAGE_SIZE=2)
+class SearchCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.accounts = create_accounts(*[f'user{i}' for i in range(7)])
+        self.asker = self.accounts[0]
+        self.profiles = UserProfile.objects.all()
+
+    def pages(self, query, asker=None):
+        result, number = [], 0
+        while True:
+            ids = search_cache.page(self.profiles, query, search_cache.cached_entry(self.profiles, query), number,
+                                    asker)
+            if ids is None:
+                return result, number
+            if not ids:
+                return result, None
+            result += ids
+            number += 1
+
+    def test_cached_pages(self):
+        ids, uncovered = self.pages({})
+        expected = list(self.profiles.search().values_list('pk', flat=True))
+        self.assertEqual(uncovered, 2)
+        self.assertEqual(ids, expected[:4])
+
+    def test_favorites_merged(self):
+        favorite = self.profiles.search().exclude(pk=self.asker.profile.pk).last()
+        self.asker.update_favorites(add=[favorite.pk])
+        ids, uncovered = self.pages({}, self.asker)
+        expected = list(self.profiles.search(asker=self.asker.profile).values_list('pk', flat=True))
+        self.assertEqual(ids[0], favorite.pk)
+        self.assertEqual(ids, expected[:len(ids)])
+
+    def test_complete_result(self):
+        with self.settings(SEARCH_CACHE_PAGES=4):
+            ids, uncovered = self.pages({'exclude': str(self.asker.profile.pk)}, self.asker)
+        self.assertIsNone(uncovered)
+        self.assertEqual(len(ids), 6)
+
+    def test_hit_does_not_spell(self):
+        with mock.patch.object(UserProfileQuerySet, 'spell', side_effect=lambda search: search) as spell:
+            search_cache.cached_entry(self.profiles, {'filter': 'user1'}, True)
+            result = search_cache.cached_entry(self.profiles, {'filter': 'user1'}, True)
+        self.assertEqual(spell.call_count, 1)
+        self.assertEqual(result['count'], 1)
+        self.assertIn('facets', result)
+
+    def test_bump(self):
+        query = {}
+        first = search_cache.key(query)
+        search_cache.bump()
+        self.assertNotEqual(search_cache.key(query), first)
+
+
+class FavoritesTest(TestCase):
+    def setUp(self):
+        self.first, self.second, self.third = create_accounts('first', 'second', 'third')
+
+    def test_update_favorites(self):
+        own, other = self.first.profile.pk, self.second.profile.pk
+        ids = self.first.update_favorites(add=[own, other, 'x', 0])
+        self.assertEqual(ids, [other])
+        self.assertEqual(self.first.update_favorites(remove=[other]), [])
+
+    def test_count_favorites(self):
+        profile = self.third.profile
+        self.first.update_favorites(add=[profile.pk])
+        self.second.update_favorites(add=[profile.pk])
+        UserProfile.objects.filter(pk=profile.pk).update(favorite_count=0)
+        UserProfile.objects.filter(pk=profile.pk).count_favorites()
+        profile.refresh_from_db()
+        self.assertEqual(profile.favorite_count, 2)
+
+
+class DeleteUnconfirmedTest(TestCase):
+    def test_delete_unconfirmed(self):
+        confirmed, = create_accounts('confirmed')
+        old, new = create_accounts('old', 'new', confirmed=False)
+        Account.objects.filter(pk=old.pk).update(created=timezone.now() - timedelta(hours=1))
+        old.update_favorites(add=[confirmed.profile.pk])
+
+        self.assertEqual(Account.objects.delete_unconfirmed(), ['old'])
+        self.assertFalse(User.objects.filter(username='old').exists())
+        self.assertTrue(Account.objects.filter(pk=new.pk).exists())
+        profile = UserProfile.objects.get(pk=old.profile.pk)
+        self.assertIsNone(profile.account)
+        confirmed.profile.refresh_from_db()
+        self.assertEqual(confirmed.profile.favorite_count, 0)
+
+
+class RecoveryCodeTest(TestCase):
+    def test_single_use(self):
+        account, = create_accounts('recover')
+        code = account.make_code('recovery')
+        self.assertTrue(account.check_code('recovery', code))
+        update_last_login(None, account.user)
+        self.assertFalse(account.check_code('recovery', code))
+        self.assertTrue(account.check_code('recovery', account.make_code('recovery')))
+
+    def test_purposes_differ(self):
+        account, = create_accounts('purpose')
+        self.assertFalse(account.check_code('recovery', account.make_code('confirm')))
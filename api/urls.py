@@ -19,7 +19,7 @@ from api.apiviews import ProjectView, LoginView, SignupView, DaysOffView, Profil
     ConfirmView, CalendarView, ProjectsView, ClientsView, ClientView, ProfileEditView, \
     ProfileTagsView, ImgView, LoginFacebookView, LoginTelegramView, OffersView, \
     ProjectsStatisticsView, ProjectResponseView, AccountView, RecoveryView, ProfileView, OffersStatisticsView, \
-    ClientsCompaniesView, FavoritesView, TagsView
+    ClientsCompaniesView, FavoritesView, TagsView, CommonFreeDaysView, CalendarFeedView, CalendarFeedIcsView
 
 urlpatterns = [
     path('login/facebook/', LoginFacebookView.as_view()),
@@ -43,6 +43,9 @@ urlpatterns = [
     path('daysoff/', DaysOffView.as_view()),
 
     path('calendar/offers/', CalendarView.as_view()),
+    path('calendar/free/', CommonFreeDaysView.as_view()),
+    path('calendar/feed/<str:token>.ics', CalendarFeedIcsView.as_view()),
+    path('calendar/feed/', CalendarFeedView.as_view()),
     path('calendar/', CalendarView.as_view()),
 
     path('offers/statistics/', OffersStatisticsView.as_view()),
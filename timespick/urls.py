@@ -13,12 +13,11 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
 from api.bot import TelegramBot
-from timespick import settings
+from api.media import url_patterns as media_url_patterns
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -26,5 +25,5 @@ urlpatterns = [
     path('bot/<token>', TelegramBot.as_view()),
     path('bot/', TelegramBot.as_view()),
 ]
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+urlpatterns += media_url_patterns()
 